@@ -0,0 +1,70 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+
+class CacheMemoria:
+    """
+    Base dos caches em memória carregados do banco (catálogo de materiais, índice de
+    localizações): controla o TTL, o lock das atualizações e as falhas de carga.
+
+    As subclasses definem SETTING_TTL, TTL_PADRAO e DESCRICAO e implementam
+    _carregar (lê o banco e troca o conteúdo), _limpar e _vazio.
+    """
+
+    SETTING_TTL = None
+    TTL_PADRAO = 300
+    DESCRICAO = "o cache"
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._atualizado_em = None
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, self.SETTING_TTL, self.TTL_PADRAO)
+
+    def invalidar(self):
+        """Descarta o cache; a próxima leitura recarrega tudo."""
+        with self._lock:
+            self._limpar()
+            self._atualizado_em = None
+
+    def _garantir_atualizado(self):
+        if (
+            self._atualizado_em is None
+            or time.monotonic() - self._atualizado_em > self.ttl
+        ):
+            self._atualizar()
+
+    def _atualizar(self, forcar=False):
+        with self._lock:
+            # Outra thread pode ter atualizado enquanto esta aguardava o lock. Nas faltas
+            # do cache (forcar), evita consultar o banco mais de uma vez por segundo.
+            if self._atualizado_em is not None:
+                idade = time.monotonic() - self._atualizado_em
+                if idade < (1 if forcar else self.ttl):
+                    return
+
+            try:
+                self._carregar()
+            except Exception as e:
+                # Mantém o conteúdo anterior; a próxima leitura tenta novamente
+                logging.error(f"Erro ao atualizar {self.DESCRICAO}: {str(e)}")
+                if self._vazio():
+                    raise
+            self._atualizado_em = time.monotonic()
+
+    def _carregar(self):
+        raise NotImplementedError
+
+    def _limpar(self):
+        raise NotImplementedError
+
+    def _vazio(self):
+        raise NotImplementedError
@@ -0,0 +1,120 @@
+from django.db import connections
+
+from kingjoe.db import todas
+from .cache_memoria import CacheMemoria
+
+
+# Atributos que descrever() preenche nos registros de peças
+CAMPOS_DESCRICAO = ("desc_material", "desc_cor_material", "unidade")
+
+
+def _texto(valor):
+    return valor.strip() if isinstance(valor, str) else valor
+
+
+def _chave(valor):
+    # Códigos comparados como no banco (collation sem distinção de maiúsculas)
+    return valor.strip().upper() if isinstance(valor, str) else valor
+
+
+class CatalogoMateriais(CacheMemoria):
+    """
+    Cache em memória das descrições de MATERIAIS e MATERIAIS_CORES.
+
+    As tabelas são carregadas por completo na primeira leitura e depois atualizadas
+    de forma incremental (pela coluna DATA_PARA_TRANSFERENCIA) sempre que o TTL vence.
+    """
+
+    SETTING_TTL = "ESTOQUE_CATALOGO_TTL"
+    TTL_PADRAO = 300
+    DESCRICAO = "o catálogo de materiais"
+
+    def __init__(self, ttl=None):
+        super().__init__(ttl)
+        self._materiais = {}  # material -> (desc_material, unid_estoque)
+        self._cores = {}  # (material, cor_material) -> desc_cor_material
+        self._marca_materiais = None
+        self._marca_cores = None
+
+    def _limpar(self):
+        self._materiais = {}
+        self._cores = {}
+        self._marca_materiais = None
+        self._marca_cores = None
+
+    def _vazio(self):
+        return not self._materiais
+
+    def descrever(self, registro):
+        """
+        Preenche desc_material, desc_cor_material e, se vazia, a unidade do registro.
+        Retorna False quando o material ou a cor não existem no catálogo.
+        """
+        self._garantir_atualizado()
+        material = _chave(registro.get("material"))
+        chave_cor = (material, _chave(registro.get("cor_material")))
+
+        if material is not None and (
+            material not in self._materiais or chave_cor not in self._cores
+        ):
+            # Material ou cor cadastrados depois da última atualização
+            self._atualizar(forcar=True)
+
+        desc_material, unidade = self._materiais.get(material, (None, None))
+        registro["desc_material"] = desc_material
+        registro["desc_cor_material"] = self._cores.get(chave_cor)
+        if registro.get("unidade") is None:
+            registro["unidade"] = unidade
+
+        return desc_material is not None and registro["desc_cor_material"] is not None
+
+    def _carregar(self):
+        materiais = self._consultar(
+            "SELECT material, desc_material, unid_estoque, data_para_transferencia FROM MATERIAIS",
+            self._marca_materiais,
+        )
+        cores = self._consultar(
+            "SELECT material, cor_material, desc_cor_material, data_para_transferencia FROM MATERIAIS_CORES",
+            self._marca_cores,
+        )
+
+        # Os dicionários são trocados por inteiro, então as leituras dispensam o lock
+        novos_materiais = dict(self._materiais)
+        for linha in materiais:
+            novos_materiais[_chave(linha.material)] = (
+                _texto(linha.desc_material),
+                _texto(linha.unid_estoque),
+            )
+
+        novas_cores = dict(self._cores)
+        for linha in cores:
+            novas_cores[(_chave(linha.material), _chave(linha.cor_material))] = _texto(
+                linha.desc_cor_material
+            )
+
+        self._materiais = novos_materiais
+        self._cores = novas_cores
+        self._marca_materiais = self._maior_marca(materiais, self._marca_materiais)
+        self._marca_cores = self._maior_marca(cores, self._marca_cores)
+
+    @staticmethod
+    def _maior_marca(linhas, atual):
+        marcas = [
+            linha.data_para_transferencia
+            for linha in linhas
+            if linha.data_para_transferencia is not None
+        ]
+        if atual is not None:
+            marcas.append(atual)
+        return max(marcas, default=None)
+
+    def _consultar(self, query, marca):
+        with connections["default"].cursor() as cursor:
+            if marca is None:
+                cursor.execute(query)
+            else:
+                cursor.execute(query + " WHERE data_para_transferencia > %s", [marca])
+            return todas(cursor)
+
+
+catalogo = CatalogoMateriais()
@@ -0,0 +1,69 @@
+from django.db import connections
+
+from kingjoe.db import linhas
+from .cache_memoria import CacheMemoria
+
+
+def chave(localizacao):
+    """Código normalizado como o banco compara localizações: sem espaços e maiúsculo."""
+    return (localizacao or "").strip().upper()
+
+
+class IndiceLocalizacoes(CacheMemoria):
+    """
+    Índice em memória de MATERIAIS_LOCALIZA (localização -> filial).
+
+    A tabela é pequena, então é recarregada por completo sempre que o TTL vence. As
+    chaves ficam em maiúsculas, como na comparação do banco (collation sem distinção
+    de maiúsculas), para que um código lido em minúsculas também seja encontrado.
+    """
+
+    SETTING_TTL = "ESTOQUE_LOCALIZACOES_TTL"
+    TTL_PADRAO = 600
+    DESCRICAO = "as localizações"
+
+    def __init__(self, ttl=None):
+        super().__init__(ttl)
+        self._filiais = {}  # LOCALIZACAO -> (localizacao como cadastrada, filial)
+
+    def _limpar(self):
+        self._filiais = {}
+
+    def _vazio(self):
+        return not self._filiais
+
+    def filial(self, localizacao):
+        """Retorna a filial da localização ou None se ela não estiver cadastrada."""
+        return self._filiais.get(self._consultar(localizacao), (None, None))[1]
+
+    def codigo(self, localizacao):
+        """Código da localização como cadastrado, ou None se ela não existir."""
+        return self._filiais.get(self._consultar(localizacao), (None, None))[0]
+
+    def existe(self, localizacao):
+        return self._consultar(localizacao) in self._filiais
+
+    def _consultar(self, localizacao):
+        self._garantir_atualizado()
+
+        localizacao = chave(localizacao)
+        if localizacao and localizacao not in self._filiais:
+            # Localização cadastrada depois da última carga
+            self._atualizar(forcar=True)
+
+        return localizacao
+
+    def _carregar(self):
+        with connections["default"].cursor() as cursor:
+            cursor.execute("SELECT localizacao, filial FROM MATERIAIS_LOCALIZA")
+            self._filiais = {
+                chave(linha.localizacao): (
+                    linha.localizacao.strip(),
+                    linha.filial.strip() if linha.filial else linha.filial,
+                )
+                for linha in linhas(cursor)
+                if linha.localizacao
+            }
+
+
+localizacoes = IndiceLocalizacoes()
@@ -0,0 +1,88 @@
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections, transaction
+
+from app_estoque_mp.services import MovimentacaoService
+
+
+class Command(BaseCommand):
+    help = (
+        "Move as movimentações finalizadas há mais de ESTOQUE_ARQUIVAMENTO_DIAS dias, "
+        "com as suas peças, para as tabelas de arquivo, em lotes limitados, e expurga "
+        "os registros de exclusão mais antigos que o prazo do feed de alterações "
+        "(ESTOQUE_ALTERACOES_DIAS). Deve rodar periodicamente: no Docker-compose.yml, "
+        "o serviço arquivar_movimentacoes o mantém em --continuo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dias",
+            type=int,
+            default=None,
+            help="Idade mínima, em dias, das finalizadas (padrão: ESTOQUE_ARQUIVAMENTO_DIAS).",
+        )
+        parser.add_argument(
+            "--continuo",
+            action="store_true",
+            help="Continua arquivando periodicamente em vez de sair sem pendências.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=3600,
+            help="Segundos de espera sem pendências, no modo contínuo.",
+        )
+
+    def handle(self, *args, **options):
+        dias = options["dias"]
+        if dias is None:
+            dias = getattr(settings, "ESTOQUE_ARQUIVAMENTO_DIAS", 180)
+
+        # Um dia de folga além do prazo do feed: uma exclusão gravada pouco antes da
+        # emissão de um token ainda aceito pode ter versão posterior à dele
+        dias_exclusoes = getattr(settings, "ESTOQUE_ALTERACOES_DIAS", 30) + 1
+
+        while True:
+            close_old_connections()
+            arquivadas = self._arquivar(datetime.now() - timedelta(days=dias))
+            expurgadas = self._expurgar(
+                datetime.now() - timedelta(days=dias_exclusoes)
+            )
+
+            if not options["continuo"]:
+                self.stdout.write(f"Movimentações arquivadas: {arquivadas}")
+                self.stdout.write(f"Registros de exclusão expurgados: {expurgadas}")
+                return
+            if arquivadas:
+                self.stdout.write(f"Movimentações arquivadas: {arquivadas}")
+            if expurgadas:
+                self.stdout.write(f"Registros de exclusão expurgados: {expurgadas}")
+            time.sleep(options["intervalo"])
+
+    def _arquivar(self, finalizadas_ate):
+        service = MovimentacaoService()
+        tamanho = service.tamanho_lote_arquivamento()
+        arquivadas = 0
+
+        while True:
+            # Cada lote em sua transação, para manter os locks curtos
+            with transaction.atomic(), connections["default"].cursor() as cursor:
+                lote = service.arquivar_lote(cursor, finalizadas_ate, tamanho)
+            arquivadas += lote
+            if lote < tamanho:
+                return arquivadas
+
+    def _expurgar(self, excluidas_ate):
+        service = MovimentacaoService()
+        tamanho = service.tamanho_lote_arquivamento()
+        expurgadas = 0
+
+        while True:
+            with transaction.atomic(), connections["default"].cursor() as cursor:
+                lote = service.expurgar_exclusoes(cursor, excluidas_ate, tamanho)
+            expurgadas += lote
+            if lote < tamanho:
+                return expurgadas
@@ -0,0 +1,95 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from app_estoque_mp.services import MovimentacaoService
+from kingjoe.db import primeira, todas
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a inserção de peças em KING_ESTOQUE_MAT_MOV_PECA linha a linha e em lote "
+        "(MovimentacaoService.inserir_pecas, usado na criação e em incluir_pecas). "
+        "Tudo é executado em uma transação desfeita ao final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pecas",
+            type=int,
+            default=300,
+            help="Quantidade de peças por movimentação.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            with connections["default"].cursor() as cursor:
+                pecas = self._obter_pecas(cursor, options["pecas"])
+                if not pecas:
+                    raise CommandError("Nenhuma peça encontrada em ESTOQUE_MAT_PECA.")
+
+                origem = pecas[0]["localizacao"]
+                linha_a_linha = self._medir(
+                    cursor, origem, pecas, self._inserir_linha_a_linha
+                )
+                em_lote = self._medir(
+                    cursor, origem, pecas, MovimentacaoService().inserir_pecas
+                )
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"Peças por movimentação: {len(pecas)}")
+        self.stdout.write(f"Linha a linha: {linha_a_linha:,.0f} linhas/s")
+        self.stdout.write(f"Em lote (OPENJSON, um comando): {em_lote:,.0f} linhas/s")
+        self.stdout.write(self.style.SUCCESS(f"Ganho: {em_lote / linha_a_linha:.1f}x"))
+
+    def _obter_pecas(self, cursor, quantidade):
+        cursor.execute(
+            """
+            SELECT TOP (%s)
+                e.peca, e.partida, e.material, e.cor_material,
+                m.unid_estoque AS unidade, e.qtde AS quantidade, e.localizacao
+            FROM ESTOQUE_MAT_PECA e
+            JOIN MATERIAIS m ON m.material = e.material
+            WHERE e.peca IS NOT NULL AND e.peca <> '' AND e.qtde > 0
+            """,
+            [quantidade],
+        )
+        return todas(cursor)
+
+    def _medir(self, cursor, origem, pecas, inserir):
+        cursor.execute(
+            """
+            INSERT INTO KING_ESTOQUE_MAT_MOV (
+                data_inicio, data_modificacao, status, usuario, origem, total_pecas
+            )
+            OUTPUT INSERTED.MOVIMENTACAO
+            VALUES (GETDATE(), GETDATE(), 'Andamento', 'benchmark', %s, %s)
+            """,
+            [origem, len(pecas)],
+        )
+        movimentacao = primeira(cursor).movimentacao
+
+        inicio = time.perf_counter()
+        inserir(cursor, movimentacao, pecas)
+        return len(pecas) / (time.perf_counter() - inicio)
+
+    def _inserir_linha_a_linha(self, cursor, movimentacao, pecas):
+        for peca in pecas:
+            cursor.execute(
+                """
+                INSERT INTO KING_ESTOQUE_MAT_MOV_PECA (
+                    movimentacao, peca, partida, material, cor_material, unidade, quantidade
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """,
+                [
+                    movimentacao,
+                    peca["peca"],
+                    peca["partida"],
+                    peca["material"],
+                    peca["cor_material"],
+                    peca["unidade"],
+                    peca["quantidade"],
+                ],
+            )
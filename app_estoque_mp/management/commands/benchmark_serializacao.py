@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app_estoque_mp.serializers import MovimentacaoSerializer, representar_movimentacao
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a serialização de movimentações pelo MovimentacaoSerializer e pela "
+        "representação rápida, com dados sintéticos (não acessa o banco)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--movimentacoes", type=int, default=50)
+        parser.add_argument("--pecas", type=int, default=200)
+        parser.add_argument("--repeticoes", type=int, default=5)
+
+    def handle(self, *args, **options):
+        movimentacoes = self._gerar(options["movimentacoes"], options["pecas"])
+
+        drf = self._medir(
+            lambda: MovimentacaoSerializer(movimentacoes, many=True).data,
+            options["repeticoes"],
+        )
+        rapida = self._medir(
+            lambda: representar_movimentacao.lista(movimentacoes),
+            options["repeticoes"],
+        )
+
+        if MovimentacaoSerializer(movimentacoes, many=True).data != (
+            representar_movimentacao.lista(movimentacoes)
+        ):
+            raise CommandError("As duas serializações produziram saídas diferentes.")
+
+        linhas = options["movimentacoes"] * options["pecas"]
+        self.stdout.write(
+            f"{options['movimentacoes']} movimentações x {options['pecas']} peças"
+        )
+        self.stdout.write(f"MovimentacaoSerializer: {linhas / drf:,.0f} peças/s")
+        self.stdout.write(f"Representação rápida: {linhas / rapida:,.0f} peças/s")
+        self.stdout.write(self.style.SUCCESS(f"Ganho: {drf / rapida:.1f}x"))
+
+    def _medir(self, funcao, repeticoes):
+        # Melhor tempo entre as repetições
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append(time.perf_counter() - inicio)
+        return min(tempos)
+
+    def _gerar(self, quantidade, pecas_por_movimentacao):
+        inicio = datetime(2024, 1, 1, 8, 0)
+        return [
+            {
+                "movimentacao": mov,
+                "data_inicio": inicio + timedelta(minutes=mov),
+                "data_modificacao": inicio + timedelta(minutes=mov, seconds=30),
+                "status": "Andamento",
+                "usuario": "benchmark",
+                "origem": "A01-01",
+                "destino": "B02-03",
+                "total_pecas": pecas_por_movimentacao,
+                "filial_origem": "MATRIZ",
+                "filial_destino": "MATRIZ",
+                "pecas": [
+                    {
+                        "peca": f"{mov:02d}{peca:04d}",
+                        "partida": "P01",
+                        "material": "10.01.0001",
+                        "desc_material": "TECIDO PLANO",
+                        "cor_material": "001",
+                        "desc_cor_material": "AZUL",
+                        "unidade": "MT",
+                        "quantidade": Decimal("12.500"),
+                        "localizacao": "A01-01",
+                        "filial": "MATRIZ",
+                    }
+                    for peca in range(pecas_por_movimentacao)
+                ],
+            }
+            for mov in range(quantidade)
+        ]
@@ -0,0 +1,78 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections, transaction
+
+from app_estoque_mp.services import MovimentacaoService
+
+
+class Command(BaseCommand):
+    help = (
+        "Processa a fila de finalizações assíncronas de movimentações "
+        "(KING_ESTOQUE_MAT_MOV_FINALIZACAO): realoca as peças e marca a "
+        "movimentação como Finalizada, com novas tentativas em caso de erro."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--continuo",
+            action="store_true",
+            help="Continua aguardando novas finalizações em vez de sair com a fila vazia.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=5,
+            help="Segundos de espera com a fila vazia, no modo contínuo.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            processadas = self._processar_fila()
+
+            if not options["continuo"]:
+                self.stdout.write(f"Finalizações processadas: {processadas}")
+                return
+            if not processadas:
+                time.sleep(options["intervalo"])
+
+    def _processar_fila(self):
+        service = MovimentacaoService()
+        processadas = 0
+
+        while True:
+            # A reserva é confirmada antes do processamento, que roda em outra transação
+            with transaction.atomic(), connections["default"].cursor() as cursor:
+                reserva = service.reservar_finalizacao(cursor)
+            if reserva is None:
+                return processadas
+
+            processadas += 1
+            try:
+                self._finalizar(service, reserva.movimentacao)
+                self.stdout.write(f"Movimentação {reserva.movimentacao} finalizada.")
+            except Exception as e:
+                logging.error(
+                    f"Erro ao finalizar a movimentação {reserva.movimentacao}: {e}"
+                )
+                with transaction.atomic(), connections["default"].cursor() as cursor:
+                    service.registrar_falha_finalizacao(
+                        cursor, reserva.movimentacao, reserva.tentativas, e
+                    )
+
+    def _finalizar(self, service, movimentacao):
+        # Cada lote da realocação é confirmado com o seu progresso: se o processo cair,
+        # a próxima tentativa continua das peças que ainda não chegaram ao destino
+        tamanho = service.tamanho_lote_realocacao()
+        while True:
+            with transaction.atomic(), connections["default"].cursor() as cursor:
+                realocadas = service.realocar_lote_finalizacao(
+                    cursor, movimentacao, tamanho
+                )
+            if realocadas < tamanho:
+                break
+
+        with transaction.atomic(), connections["default"].cursor() as cursor:
+            service.concluir_finalizacao(cursor, movimentacao)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from app_estoque_mp.services import MovimentacaoService
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula o saldo por localização (KING_ESTOQUE_MAT_SALDO) a partir de "
+        "ESTOQUE_MAT_PECA, como na carga da migração 0011. Corrige diferenças de "
+        "alterações de estoque feitas fora do ScanMove."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connections["default"].cursor() as cursor:
+            linhas = MovimentacaoService().reconstruir_saldo(cursor)
+        self.stdout.write(f"Saldo reconstruído: {linhas} linhas.")
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = []
+
+    operations = [
+        # Índices de suporte à paginação por seek em (data_inicio, movimentacao),
+        # com e sem o filtro de usuário
+        migrations.RunSQL(
+            sql="""
+                IF NOT EXISTS (
+                    SELECT 1 FROM sys.indexes
+                    WHERE name = 'IX_KING_ESTOQUE_MAT_MOV_DATA_INICIO'
+                      AND object_id = OBJECT_ID('KING_ESTOQUE_MAT_MOV')
+                )
+                CREATE INDEX IX_KING_ESTOQUE_MAT_MOV_DATA_INICIO
+                    ON KING_ESTOQUE_MAT_MOV (DATA_INICIO DESC, MOVIMENTACAO DESC)
+                    INCLUDE (USUARIO, STATUS, ORIGEM, DESTINO)
+            """,
+            reverse_sql="""
+                DROP INDEX IF EXISTS IX_KING_ESTOQUE_MAT_MOV_DATA_INICIO
+                    ON KING_ESTOQUE_MAT_MOV
+            """,
+        ),
+        migrations.RunSQL(
+            sql="""
+                IF NOT EXISTS (
+                    SELECT 1 FROM sys.indexes
+                    WHERE name = 'IX_KING_ESTOQUE_MAT_MOV_USUARIO_DATA_INICIO'
+                      AND object_id = OBJECT_ID('KING_ESTOQUE_MAT_MOV')
+                )
+                CREATE INDEX IX_KING_ESTOQUE_MAT_MOV_USUARIO_DATA_INICIO
+                    ON KING_ESTOQUE_MAT_MOV (USUARIO, DATA_INICIO DESC, MOVIMENTACAO DESC)
+                    INCLUDE (STATUS, ORIGEM, DESTINO)
+            """,
+            reverse_sql="""
+                DROP INDEX IF EXISTS IX_KING_ESTOQUE_MAT_MOV_USUARIO_DATA_INICIO
+                    ON KING_ESTOQUE_MAT_MOV
+            """,
+        ),
+    ]
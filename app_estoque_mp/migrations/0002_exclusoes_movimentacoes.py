@@ -0,0 +1,58 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_estoque_mp", "0001_indices_historico_movimentacoes"),
+    ]
+
+    operations = [
+        # Registro das exclusões (movimentações inteiras ou peças) para o feed de
+        # alterações; PECA nulo indica a exclusão da movimentação
+        migrations.RunSQL(
+            sql="""
+                IF OBJECT_ID('KING_ESTOQUE_MAT_MOV_EXCLUSAO') IS NULL
+                CREATE TABLE KING_ESTOQUE_MAT_MOV_EXCLUSAO (
+                    ID INT IDENTITY(1, 1) NOT NULL PRIMARY KEY,
+                    MOVIMENTACAO INT NOT NULL,
+                    PECA VARCHAR(6) NULL,
+                    USUARIO VARCHAR(25) NOT NULL,
+                    DATA_EXCLUSAO DATETIME NOT NULL DEFAULT GETDATE()
+                )
+            """,
+            reverse_sql="DROP TABLE IF EXISTS KING_ESTOQUE_MAT_MOV_EXCLUSAO",
+        ),
+        migrations.RunSQL(
+            sql="""
+                IF NOT EXISTS (
+                    SELECT 1 FROM sys.indexes
+                    WHERE name = 'IX_KING_ESTOQUE_MAT_MOV_EXCLUSAO_USUARIO'
+                      AND object_id = OBJECT_ID('KING_ESTOQUE_MAT_MOV_EXCLUSAO')
+                )
+                CREATE INDEX IX_KING_ESTOQUE_MAT_MOV_EXCLUSAO_USUARIO
+                    ON KING_ESTOQUE_MAT_MOV_EXCLUSAO (USUARIO, ID)
+                    INCLUDE (MOVIMENTACAO, PECA, DATA_EXCLUSAO)
+            """,
+            reverse_sql="""
+                DROP INDEX IF EXISTS IX_KING_ESTOQUE_MAT_MOV_EXCLUSAO_USUARIO
+                    ON KING_ESTOQUE_MAT_MOV_EXCLUSAO
+            """,
+        ),
+        # Leitura das movimentações alteradas depois de uma marca, por usuário
+        migrations.RunSQL(
+            sql="""
+                IF NOT EXISTS (
+                    SELECT 1 FROM sys.indexes
+                    WHERE name = 'IX_KING_ESTOQUE_MAT_MOV_USUARIO_DATA_MODIFICACAO'
+                      AND object_id = OBJECT_ID('KING_ESTOQUE_MAT_MOV')
+                )
+                CREATE INDEX IX_KING_ESTOQUE_MAT_MOV_USUARIO_DATA_MODIFICACAO
+                    ON KING_ESTOQUE_MAT_MOV (USUARIO, DATA_MODIFICACAO)
+            """,
+            reverse_sql="""
+                DROP INDEX IF EXISTS IX_KING_ESTOQUE_MAT_MOV_USUARIO_DATA_MODIFICACAO
+                    ON KING_ESTOQUE_MAT_MOV
+            """,
+        ),
+    ]
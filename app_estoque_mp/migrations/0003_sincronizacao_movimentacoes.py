@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_estoque_mp", "0002_exclusoes_movimentacoes"),
+    ]
+
+    operations = [
+        # Operações já aplicadas pela sincronização em lote, pelo id gerado no
+        # coletor; reenviar o mesmo lote devolve o resultado registrado
+        migrations.RunSQL(
+            sql="""
+                IF OBJECT_ID('KING_ESTOQUE_MAT_MOV_SYNC') IS NULL
+                CREATE TABLE KING_ESTOQUE_MAT_MOV_SYNC (
+                    USUARIO VARCHAR(25) NOT NULL,
+                    ID_CLIENTE VARCHAR(64) NOT NULL,
+                    TIPO VARCHAR(30) NOT NULL,
+                    MOVIMENTACAO INT NULL,
+                    STATUS_HTTP SMALLINT NOT NULL,
+                    DETALHE NVARCHAR(255) NULL,
+                    DATA_PROCESSAMENTO DATETIME NOT NULL DEFAULT GETDATE(),
+                    CONSTRAINT PK_KING_ESTOQUE_MAT_MOV_SYNC
+                        PRIMARY KEY (USUARIO, ID_CLIENTE)
+                )
+            """,
+            reverse_sql="DROP TABLE IF EXISTS KING_ESTOQUE_MAT_MOV_SYNC",
+        ),
+    ]
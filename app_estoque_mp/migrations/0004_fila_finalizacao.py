@@ -0,0 +1,81 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_estoque_mp", "0003_sincronizacao_movimentacoes"),
+    ]
+
+    operations = [
+        # O status 'Finalizando' tem 11 caracteres. Se a coluna for menor, ela é
+        # alargada; os índices que incluem STATUS precisam ser recriados em volta
+        migrations.RunSQL(
+            sql="""
+                IF EXISTS (
+                    SELECT 1
+                    FROM sys.columns c
+                    JOIN sys.types t ON t.user_type_id = c.user_type_id
+                    WHERE c.object_id = OBJECT_ID('KING_ESTOQUE_MAT_MOV')
+                      AND c.name = 'STATUS'
+                      AND t.name IN ('varchar', 'char')
+                      AND c.max_length BETWEEN 1 AND 10
+                )
+                BEGIN
+                    DROP INDEX IF EXISTS IX_KING_ESTOQUE_MAT_MOV_DATA_INICIO
+                        ON KING_ESTOQUE_MAT_MOV;
+                    DROP INDEX IF EXISTS IX_KING_ESTOQUE_MAT_MOV_USUARIO_DATA_INICIO
+                        ON KING_ESTOQUE_MAT_MOV;
+
+                    DECLARE @nulo VARCHAR(8) = CASE
+                        WHEN COLUMNPROPERTY(
+                            OBJECT_ID('KING_ESTOQUE_MAT_MOV'), 'STATUS', 'AllowsNull'
+                        ) = 1 THEN 'NULL'
+                        ELSE 'NOT NULL'
+                    END;
+                    EXEC('ALTER TABLE KING_ESTOQUE_MAT_MOV ALTER COLUMN STATUS VARCHAR(11) ' + @nulo);
+
+                    CREATE INDEX IX_KING_ESTOQUE_MAT_MOV_DATA_INICIO
+                        ON KING_ESTOQUE_MAT_MOV (DATA_INICIO DESC, MOVIMENTACAO DESC)
+                        INCLUDE (USUARIO, STATUS, ORIGEM, DESTINO);
+                    CREATE INDEX IX_KING_ESTOQUE_MAT_MOV_USUARIO_DATA_INICIO
+                        ON KING_ESTOQUE_MAT_MOV (USUARIO, DATA_INICIO DESC, MOVIMENTACAO DESC)
+                        INCLUDE (STATUS, ORIGEM, DESTINO);
+                END
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        # Fila das finalizações assíncronas, uma linha por movimentação. PROXIMA_TENTATIVA
+        # marca quando a linha pode ser (re)processada: ao ser reservada, recebe o prazo
+        # do processamento, e uma reserva abandonada volta para a fila depois dele
+        migrations.RunSQL(
+            sql="""
+                IF OBJECT_ID('KING_ESTOQUE_MAT_MOV_FINALIZACAO') IS NULL
+                CREATE TABLE KING_ESTOQUE_MAT_MOV_FINALIZACAO (
+                    MOVIMENTACAO INT NOT NULL PRIMARY KEY,
+                    STATUS VARCHAR(11) NOT NULL DEFAULT 'Pendente',
+                    TENTATIVAS INT NOT NULL DEFAULT 0,
+                    PROXIMA_TENTATIVA DATETIME NOT NULL DEFAULT GETDATE(),
+                    ERRO NVARCHAR(1000) NULL,
+                    DATA_SOLICITACAO DATETIME NOT NULL DEFAULT GETDATE(),
+                    DATA_CONCLUSAO DATETIME NULL
+                )
+            """,
+            reverse_sql="DROP TABLE IF EXISTS KING_ESTOQUE_MAT_MOV_FINALIZACAO",
+        ),
+        migrations.RunSQL(
+            sql="""
+                IF NOT EXISTS (
+                    SELECT 1 FROM sys.indexes
+                    WHERE name = 'IX_KING_ESTOQUE_MAT_MOV_FINALIZACAO_FILA'
+                      AND object_id = OBJECT_ID('KING_ESTOQUE_MAT_MOV_FINALIZACAO')
+                )
+                CREATE INDEX IX_KING_ESTOQUE_MAT_MOV_FINALIZACAO_FILA
+                    ON KING_ESTOQUE_MAT_MOV_FINALIZACAO (STATUS, PROXIMA_TENTATIVA)
+            """,
+            reverse_sql="""
+                DROP INDEX IF EXISTS IX_KING_ESTOQUE_MAT_MOV_FINALIZACAO_FILA
+                    ON KING_ESTOQUE_MAT_MOV_FINALIZACAO
+            """,
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_estoque_mp", "0004_fila_finalizacao"),
+    ]
+
+    operations = [
+        # Peças já realocadas pela finalização em lotes
+        migrations.RunSQL(
+            sql="""
+                IF COL_LENGTH('KING_ESTOQUE_MAT_MOV_FINALIZACAO', 'PECAS_REALOCADAS') IS NULL
+                ALTER TABLE KING_ESTOQUE_MAT_MOV_FINALIZACAO
+                    ADD PECAS_REALOCADAS INT NOT NULL
+                    CONSTRAINT DF_KING_ESTOQUE_MAT_MOV_FINALIZACAO_PECAS_REALOCADAS DEFAULT 0
+            """,
+            reverse_sql="""
+                ALTER TABLE KING_ESTOQUE_MAT_MOV_FINALIZACAO
+                    DROP CONSTRAINT IF EXISTS DF_KING_ESTOQUE_MAT_MOV_FINALIZACAO_PECAS_REALOCADAS;
+                ALTER TABLE KING_ESTOQUE_MAT_MOV_FINALIZACAO
+                    DROP COLUMN IF EXISTS PECAS_REALOCADAS
+            """,
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_estoque_mp", "0005_progresso_finalizacao"),
+    ]
+
+    operations = [
+        # Busca, por peça, da movimentação aberta em que ela já está (validação das
+        # peças incluídas em uma movimentação)
+        migrations.RunSQL(
+            sql="""
+                IF NOT EXISTS (
+                    SELECT 1 FROM sys.indexes
+                    WHERE name = 'IX_KING_ESTOQUE_MAT_MOV_PECA_PECA'
+                      AND object_id = OBJECT_ID('KING_ESTOQUE_MAT_MOV_PECA')
+                )
+                CREATE INDEX IX_KING_ESTOQUE_MAT_MOV_PECA_PECA
+                    ON KING_ESTOQUE_MAT_MOV_PECA (PECA)
+                    INCLUDE (MOVIMENTACAO)
+            """,
+            reverse_sql="""
+                DROP INDEX IF EXISTS IX_KING_ESTOQUE_MAT_MOV_PECA_PECA
+                    ON KING_ESTOQUE_MAT_MOV_PECA
+            """,
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_estoque_mp", "0006_indice_pecas_movimentacao"),
+    ]
+
+    operations = [
+        # Saldo de peças por localização, material e cor. É carregado pela 0011, mantido
+        # pelas finalizações das movimentações e pode ser recalculado por completo com o
+        # comando reconstruir_saldo (correção de alterações feitas no ERP)
+        migrations.RunSQL(
+            sql="""
+                IF OBJECT_ID('KING_ESTOQUE_MAT_SALDO') IS NULL
+                CREATE TABLE KING_ESTOQUE_MAT_SALDO (
+                    LOCALIZACAO VARCHAR(8) NOT NULL,
+                    MATERIAL VARCHAR(11) NOT NULL,
+                    COR_MATERIAL VARCHAR(10) NOT NULL,
+                    PECAS INT NOT NULL,
+                    QUANTIDADE DECIMAL(18, 3) NOT NULL,
+                    DATA_ATUALIZACAO DATETIME NOT NULL DEFAULT GETDATE(),
+                    CONSTRAINT PK_KING_ESTOQUE_MAT_SALDO
+                        PRIMARY KEY (LOCALIZACAO, MATERIAL, COR_MATERIAL)
+                )
+            """,
+            reverse_sql="DROP TABLE IF EXISTS KING_ESTOQUE_MAT_SALDO",
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_estoque_mp", "0007_saldo_localizacoes"),
+    ]
+
+    operations = [
+        # Peças de uma localização em ordem de código (listagem paginada por seek e
+        # carga das peças da origem); as colunas incluídas evitam o lookup na tabela
+        migrations.RunSQL(
+            sql="""
+                IF NOT EXISTS (
+                    SELECT 1 FROM sys.indexes
+                    WHERE name = 'IX_ESTOQUE_MAT_PECA_LOCALIZACAO_PECA'
+                      AND object_id = OBJECT_ID('ESTOQUE_MAT_PECA')
+                )
+                CREATE INDEX IX_ESTOQUE_MAT_PECA_LOCALIZACAO_PECA
+                    ON ESTOQUE_MAT_PECA (LOCALIZACAO, PECA)
+                    INCLUDE (PARTIDA, FILIAL, MATERIAL, COR_MATERIAL, QTDE)
+            """,
+            reverse_sql="""
+                DROP INDEX IF EXISTS IX_ESTOQUE_MAT_PECA_LOCALIZACAO_PECA
+                    ON ESTOQUE_MAT_PECA
+            """,
+        ),
+    ]
@@ -0,0 +1,87 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_estoque_mp", "0008_indice_pecas_localizacao"),
+    ]
+
+    operations = [
+        # Tabelas de arquivo das movimentações finalizadas (arquivar_movimentacoes).
+        # São criadas a partir das ativas para herdar os mesmos tipos de coluna; a
+        # MOVIMENTACAO é convertida para perder o IDENTITY e mantida NOT NULL
+        migrations.RunSQL(
+            sql="""
+                IF OBJECT_ID('KING_ESTOQUE_MAT_MOV_ARQ') IS NULL
+                BEGIN
+                    SELECT TOP (0)
+                        ISNULL(CAST(MOVIMENTACAO AS INT), 0) AS MOVIMENTACAO,
+                        DATA_INICIO, DATA_MODIFICACAO, STATUS,
+                        USUARIO, ORIGEM, DESTINO, TOTAL_PECAS
+                    INTO KING_ESTOQUE_MAT_MOV_ARQ
+                    FROM KING_ESTOQUE_MAT_MOV;
+
+                    ALTER TABLE KING_ESTOQUE_MAT_MOV_ARQ
+                        ADD CONSTRAINT PK_KING_ESTOQUE_MAT_MOV_ARQ
+                        PRIMARY KEY (MOVIMENTACAO);
+                END
+            """,
+            reverse_sql="DROP TABLE IF EXISTS KING_ESTOQUE_MAT_MOV_ARQ",
+        ),
+        migrations.RunSQL(
+            sql="""
+                IF OBJECT_ID('KING_ESTOQUE_MAT_MOV_PECA_ARQ') IS NULL
+                BEGIN
+                    SELECT TOP (0)
+                        MOVIMENTACAO, PECA, PARTIDA, MATERIAL,
+                        COR_MATERIAL, UNIDADE, QUANTIDADE
+                    INTO KING_ESTOQUE_MAT_MOV_PECA_ARQ
+                    FROM KING_ESTOQUE_MAT_MOV_PECA;
+
+                    CREATE CLUSTERED INDEX IX_KING_ESTOQUE_MAT_MOV_PECA_ARQ_MOVIMENTACAO
+                        ON KING_ESTOQUE_MAT_MOV_PECA_ARQ (MOVIMENTACAO, PECA);
+                END
+            """,
+            reverse_sql="DROP TABLE IF EXISTS KING_ESTOQUE_MAT_MOV_PECA_ARQ",
+        ),
+        # Mesmos índices de seek do histórico que as ativas têm (0001)
+        migrations.RunSQL(
+            sql="""
+                IF NOT EXISTS (
+                    SELECT 1 FROM sys.indexes
+                    WHERE name = 'IX_KING_ESTOQUE_MAT_MOV_ARQ_DATA_INICIO'
+                      AND object_id = OBJECT_ID('KING_ESTOQUE_MAT_MOV_ARQ')
+                )
+                CREATE INDEX IX_KING_ESTOQUE_MAT_MOV_ARQ_DATA_INICIO
+                    ON KING_ESTOQUE_MAT_MOV_ARQ (DATA_INICIO DESC, MOVIMENTACAO DESC)
+                    INCLUDE (USUARIO, STATUS, ORIGEM, DESTINO);
+
+                IF NOT EXISTS (
+                    SELECT 1 FROM sys.indexes
+                    WHERE name = 'IX_KING_ESTOQUE_MAT_MOV_ARQ_USUARIO_DATA_INICIO'
+                      AND object_id = OBJECT_ID('KING_ESTOQUE_MAT_MOV_ARQ')
+                )
+                CREATE INDEX IX_KING_ESTOQUE_MAT_MOV_ARQ_USUARIO_DATA_INICIO
+                    ON KING_ESTOQUE_MAT_MOV_ARQ (USUARIO, DATA_INICIO DESC, MOVIMENTACAO DESC)
+                    INCLUDE (STATUS, ORIGEM, DESTINO);
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        # Seleção dos lotes a arquivar: finalizadas por data da última modificação
+        migrations.RunSQL(
+            sql="""
+                IF NOT EXISTS (
+                    SELECT 1 FROM sys.indexes
+                    WHERE name = 'IX_KING_ESTOQUE_MAT_MOV_STATUS_DATA_MODIFICACAO'
+                      AND object_id = OBJECT_ID('KING_ESTOQUE_MAT_MOV')
+                )
+                CREATE INDEX IX_KING_ESTOQUE_MAT_MOV_STATUS_DATA_MODIFICACAO
+                    ON KING_ESTOQUE_MAT_MOV (STATUS, DATA_MODIFICACAO)
+            """,
+            reverse_sql="""
+                DROP INDEX IF EXISTS IX_KING_ESTOQUE_MAT_MOV_STATUS_DATA_MODIFICACAO
+                    ON KING_ESTOQUE_MAT_MOV
+            """,
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_estoque_mp", "0009_arquivo_movimentacoes"),
+    ]
+
+    operations = [
+        # Marca do feed de alterações atribuída pelo servidor: a ROWVERSION muda a cada
+        # INSERT/UPDATE da linha, inclusive os feitos fora da API, e é única no banco,
+        # então uma só marca cobre as movimentações e os registros de exclusão
+        migrations.RunSQL(
+            sql="""
+                IF COL_LENGTH('KING_ESTOQUE_MAT_MOV', 'VERSAO') IS NULL
+                ALTER TABLE KING_ESTOQUE_MAT_MOV ADD VERSAO ROWVERSION
+            """,
+            reverse_sql="""
+                ALTER TABLE KING_ESTOQUE_MAT_MOV DROP COLUMN IF EXISTS VERSAO
+            """,
+        ),
+        migrations.RunSQL(
+            sql="""
+                IF COL_LENGTH('KING_ESTOQUE_MAT_MOV_EXCLUSAO', 'VERSAO') IS NULL
+                ALTER TABLE KING_ESTOQUE_MAT_MOV_EXCLUSAO ADD VERSAO ROWVERSION
+            """,
+            reverse_sql="""
+                ALTER TABLE KING_ESTOQUE_MAT_MOV_EXCLUSAO DROP COLUMN IF EXISTS VERSAO
+            """,
+        ),
+        migrations.RunSQL(
+            sql="""
+                IF NOT EXISTS (
+                    SELECT 1 FROM sys.indexes
+                    WHERE name = 'IX_KING_ESTOQUE_MAT_MOV_USUARIO_VERSAO'
+                      AND object_id = OBJECT_ID('KING_ESTOQUE_MAT_MOV')
+                )
+                CREATE INDEX IX_KING_ESTOQUE_MAT_MOV_USUARIO_VERSAO
+                    ON KING_ESTOQUE_MAT_MOV (USUARIO, VERSAO)
+            """,
+            reverse_sql="""
+                DROP INDEX IF EXISTS IX_KING_ESTOQUE_MAT_MOV_USUARIO_VERSAO
+                    ON KING_ESTOQUE_MAT_MOV
+            """,
+        ),
+        migrations.RunSQL(
+            sql="""
+                IF NOT EXISTS (
+                    SELECT 1 FROM sys.indexes
+                    WHERE name = 'IX_KING_ESTOQUE_MAT_MOV_EXCLUSAO_USUARIO_VERSAO'
+                      AND object_id = OBJECT_ID('KING_ESTOQUE_MAT_MOV_EXCLUSAO')
+                )
+                CREATE INDEX IX_KING_ESTOQUE_MAT_MOV_EXCLUSAO_USUARIO_VERSAO
+                    ON KING_ESTOQUE_MAT_MOV_EXCLUSAO (USUARIO, VERSAO)
+                    INCLUDE (MOVIMENTACAO, PECA, DATA_EXCLUSAO)
+            """,
+            reverse_sql="""
+                DROP INDEX IF EXISTS IX_KING_ESTOQUE_MAT_MOV_EXCLUSAO_USUARIO_VERSAO
+                    ON KING_ESTOQUE_MAT_MOV_EXCLUSAO
+            """,
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_estoque_mp", "0010_versao_alteracoes"),
+    ]
+
+    operations = [
+        # Carga do saldo por localização a partir de ESTOQUE_MAT_PECA, a mesma do
+        # comando reconstruir_saldo. Sem ela, as finalizações aplicariam diferenças em
+        # uma tabela vazia e o saldo teria só as peças movidas desde a 0007; por isso
+        # as linhas que elas já criaram são descartadas e a tabela é recalculada
+        migrations.RunSQL(
+            sql="""
+                DELETE FROM KING_ESTOQUE_MAT_SALDO WITH (TABLOCKX);
+
+                INSERT INTO KING_ESTOQUE_MAT_SALDO (
+                    LOCALIZACAO, MATERIAL, COR_MATERIAL, PECAS, QUANTIDADE, DATA_ATUALIZACAO
+                )
+                SELECT 
+                    e.LOCALIZACAO,
+                    e.MATERIAL,
+                    e.COR_MATERIAL,
+                    COUNT(*),
+                    SUM(e.QTDE),
+                    GETDATE()
+                FROM 
+                    ESTOQUE_MAT_PECA e
+                WHERE 
+                    e.LOCALIZACAO IS NOT NULL
+                AND e.PECA IS NOT NULL 
+                AND e.PECA <> '' 
+                AND e.QTDE > 0
+                GROUP BY 
+                    e.LOCALIZACAO, e.MATERIAL, e.COR_MATERIAL
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .localizacoes import chave
+
+
+class PecasOrigem:
+    """
+    Cache em memória, por usuário, das peças em estoque na origem da movimentação
+    que ele está montando.
+
+    Ao criar a movimentação (ou trocar a origem), todas as peças da localização são
+    lidas em uma consulta e guardadas aqui; as leituras seguintes do coletor na mesma
+    origem são respondidas sem ir ao banco. Cada usuário tem uma única origem em
+    cache, que vence pelo TTL ou quando a movimentação é finalizada ou excluída. O
+    número de usuários é limitado, descartando o menos usado.
+    """
+
+    def __init__(self, ttl=None, max_usuarios=None, max_pecas=None):
+        self._ttl = ttl
+        self._max_usuarios = max_usuarios
+        self._max_pecas = max_pecas
+        self._lock = threading.Lock()
+        # usuario -> (movimentacao, localizacao, expira_em, {peca: registro})
+        self._entradas = OrderedDict()
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, "ESTOQUE_PREFETCH_TTL", 300)
+
+    @property
+    def max_usuarios(self):
+        if self._max_usuarios is not None:
+            return self._max_usuarios
+        return getattr(settings, "ESTOQUE_PREFETCH_USUARIOS", 200)
+
+    @property
+    def max_pecas(self):
+        """Localizações com mais peças do que isso não são guardadas."""
+        if self._max_pecas is not None:
+            return self._max_pecas
+        return getattr(settings, "ESTOQUE_PREFETCH_MAX_PECAS", 5000)
+
+    def guardar(self, usuario, movimentacao, localizacao, pecas):
+        """Substitui a origem em cache do usuário pelas peças informadas."""
+        if not self.ttl or len(pecas) > self.max_pecas:
+            self.descartar_usuario(usuario)
+            return
+
+        entrada = (
+            movimentacao,
+            chave(localizacao),
+            time.monotonic() + self.ttl,
+            {peca.peca: peca for peca in pecas},
+        )
+        with self._lock:
+            self._entradas[usuario] = entrada
+            self._entradas.move_to_end(usuario)
+            while len(self._entradas) > self.max_usuarios:
+                self._entradas.popitem(last=False)
+
+    def obter(self, usuario, peca):
+        """Registro da peça na origem em cache do usuário, ou None se não estiver nela."""
+        with self._lock:
+            entrada = self._entradas.get(usuario)
+            if entrada is None:
+                return None
+            if time.monotonic() > entrada[2]:
+                del self._entradas[usuario]
+                return None
+            self._entradas.move_to_end(usuario)
+            return entrada[3].get(peca)
+
+    def descartar_usuario(self, usuario):
+        with self._lock:
+            self._entradas.pop(usuario, None)
+
+    def descartar_movimentacao(self, movimentacao):
+        """
+        Descarta a origem em cache da movimentação. As entradas de outros usuários
+        na mesma localização continuam: quando as peças saem dela (finalização),
+        quem chama também descarta a localização.
+        """
+        with self._lock:
+            for usuario in [
+                usuario
+                for usuario, entrada in self._entradas.items()
+                if entrada[0] == movimentacao
+            ]:
+                del self._entradas[usuario]
+
+    def descartar_localizacao(self, localizacao):
+        """Descarta a localização para todos os usuários: as peças dela mudaram."""
+        localizacao = chave(localizacao)
+        with self._lock:
+            for usuario in [
+                usuario
+                for usuario, entrada in self._entradas.items()
+                if entrada[1] == localizacao
+            ]:
+                del self._entradas[usuario]
+
+    def invalidar(self):
+        with self._lock:
+            self._entradas.clear()
+
+
+pecas_origem = PecasOrigem()
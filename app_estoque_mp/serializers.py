@@ -1,4 +1,26 @@
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import serializers
+from .localizacoes import localizacoes
+
+
+class LocalizacaoField(serializers.CharField):
+    """
+    Código de uma localização cadastrada. O valor validado é o código como está em
+    MATERIAIS_LOCALIZA, mesmo que tenha sido lido em minúsculas.
+    """
+
+    def to_internal_value(self, data):
+        valor = super().to_internal_value(data)
+        if not valor:
+            return valor
+        codigo = localizacoes.codigo(valor)
+        if codigo is None:
+            raise serializers.ValidationError(f"Localização '{valor}' não encontrada.")
+        return codigo
 
 
 class LocalizacoesSerializer(serializers.Serializer):
@@ -37,16 +59,54 @@ class PecaSerializer(serializers.Serializer):
         return representation
 
 
+class ConsultaPecasSerializer(serializers.Serializer):
+    pecas = serializers.ListField(
+        child=serializers.CharField(max_length=6),
+        allow_empty=False,
+        max_length=1000,
+        help_text="Códigos das peças lidas pelo coletor.",
+    )
+
+
+class PecasEncontradasSerializer(serializers.Serializer):
+    pecas = PecaSerializer(many=True)
+    nao_encontradas = serializers.ListField(child=serializers.CharField())
+
+
+class PeriodoSerializer(serializers.Serializer):
+    data_de = serializers.DateField(required=False)
+    data_ate = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        data_de = attrs.get("data_de") or attrs.get("data_ate") or timezone.localdate()
+        data_ate = attrs.get("data_ate") or data_de
+        if data_ate < data_de:
+            raise serializers.ValidationError(
+                "data_ate deve ser igual ou posterior a data_de."
+            )
+        attrs["data_de"], attrs["data_ate"] = data_de, data_ate
+        return attrs
+
+    def intervalo(self):
+        """Período como intervalo semiaberto [início, fim) de datetimes."""
+        data_de = self.validated_data["data_de"]
+        data_ate = self.validated_data["data_ate"]
+        return (
+            datetime.combine(data_de, time.min),
+            datetime.combine(data_ate + timedelta(days=1), time.min),
+        )
+
+
 class MovimentacaoSerializer(serializers.Serializer):
     movimentacao = serializers.IntegerField(
         read_only=True
     )  # Tornar read_only para criação
     data_inicio = serializers.DateTimeField()
     data_modificacao = serializers.DateTimeField()
-    status = serializers.CharField(max_length=10)
+    status = serializers.CharField(max_length=11)
     usuario = serializers.CharField(max_length=25)
-    origem = serializers.CharField(max_length=8)
-    destino = serializers.CharField(max_length=8)
+    origem = LocalizacaoField(max_length=8)
+    destino = LocalizacaoField(max_length=8)
     total_pecas = serializers.IntegerField()
     filial_origem = serializers.CharField(
         max_length=25, read_only=True
@@ -64,18 +124,261 @@ class MovimentacaoSerializer(serializers.Serializer):
         return representation
 
 
+class MovimentacaoPaleteSerializer(serializers.Serializer):
+    data_inicio = serializers.DateTimeField()
+    data_modificacao = serializers.DateTimeField()
+    usuario = serializers.CharField(max_length=25)
+    origem = LocalizacaoField(max_length=8)
+    destino = LocalizacaoField(max_length=8)
+    material = serializers.CharField(
+        max_length=11,
+        required=False,
+        help_text="Move só as peças deste material; sem ele, a origem inteira.",
+    )
+    finalizar = serializers.BooleanField(
+        required=False,
+        default=False,
+        help_text="Finaliza a movimentação logo após criá-la.",
+    )
+    assincrono = serializers.BooleanField(
+        required=False,
+        default=False,
+        help_text="Com finalizar, agenda a finalização (resposta 202).",
+    )
+
+    def validate(self, data):
+        if data["origem"].strip() == data["destino"].strip():
+            raise serializers.ValidationError("A origem deve ser diferente do destino.")
+        return data
+
+
+class MovimentacaoPaleteCriadaSerializer(serializers.Serializer):
+    movimentacao = serializers.IntegerField()
+    total_pecas = serializers.IntegerField()
+    status = serializers.CharField()
+
+
+class ResumoItemSerializer(serializers.Serializer):
+    material = serializers.CharField()
+    desc_material = serializers.CharField(allow_null=True)
+    cor_material = serializers.CharField()
+    desc_cor_material = serializers.CharField(allow_null=True)
+    unidade = serializers.CharField(allow_null=True)
+    pecas = serializers.IntegerField()
+    quantidade = serializers.DecimalField(max_digits=14, decimal_places=3)
+
+
+class ResumoMovimentacaoSerializer(serializers.Serializer):
+    movimentacao = serializers.IntegerField()
+    status = serializers.CharField()
+    usuario = serializers.CharField()
+    origem = serializers.CharField()
+    destino = serializers.CharField(allow_null=True)
+    total_pecas = serializers.IntegerField()
+    itens = ResumoItemSerializer(many=True)
+
+
+class FiltroResumoDiarioSerializer(PeriodoSerializer):
+    usuario = serializers.CharField(max_length=25, required=False)
+
+
+class ResumoDiarioSerializer(serializers.Serializer):
+    usuario = serializers.CharField()
+    dia = serializers.DateField()
+    movimentacoes = serializers.IntegerField()
+    finalizadas = serializers.IntegerField()
+    pecas = serializers.IntegerField()
+    quantidade = serializers.DecimalField(max_digits=14, decimal_places=3)
+
+
+class CursorMixin:
+    """
+    Cursor opaco da paginação por seek: a chave do último item da página, assinada
+    com SALT_CURSOR. O filtro define a chave do item (chave_cursor) e como lê-la de
+    volta (ler_cursor), levantando TypeError ou ValueError se ela não servir.
+    """
+
+    SALT_CURSOR = None
+
+    @classmethod
+    def gerar_cursor(cls, item):
+        return signing.dumps(cls.chave_cursor(item), salt=cls.SALT_CURSOR)
+
+    def validate_cursor(self, valor):
+        try:
+            return self.ler_cursor(signing.loads(valor, salt=self.SALT_CURSOR))
+        except (signing.BadSignature, TypeError, ValueError):
+            raise serializers.ValidationError("Cursor inválido.")
+
+
+class FiltroPecasLocalizacaoSerializer(CursorMixin, serializers.Serializer):
+    limite = serializers.IntegerField(min_value=1, max_value=2000, default=500)
+    cursor = serializers.CharField(required=False)
+
+    SALT_CURSOR = "app_estoque_mp.pecas_localizacao"
+
+    @staticmethod
+    def chave_cursor(peca):
+        # O código da última peça da página
+        return peca
+
+    @staticmethod
+    def ler_cursor(peca):
+        if not isinstance(peca, str):
+            raise TypeError(peca)
+        return peca
+
+
+class PecasLocalizacaoSerializer(serializers.Serializer):
+    resultados = PecaSerializer(many=True)
+    proximo = serializers.CharField(allow_null=True)
+
+
+class ConferenciaSerializer(serializers.Serializer):
+    pecas = serializers.ListField(
+        child=serializers.CharField(max_length=6),
+        max_length=20000,
+        help_text="Códigos de todas as peças lidas na localização durante a contagem.",
+    )
+
+
+class ConferenciaLocalizacaoSerializer(serializers.Serializer):
+    localizacao = serializers.CharField()
+    lidas = serializers.IntegerField()
+    esperadas = serializers.IntegerField()
+    conferidas = serializers.IntegerField()
+    faltantes = PecaSerializer(many=True)
+    excedentes = PecaSerializer(
+        many=True, help_text="Peças lidas com a localização em que estão registradas."
+    )
+    desconhecidas = serializers.ListField(child=serializers.CharField())
+
+
+class FiltroSaldoSerializer(serializers.Serializer):
+    localizacao = LocalizacaoField(max_length=8, required=False)
+    filial = serializers.CharField(max_length=25, required=False)
+    material = serializers.CharField(max_length=11, required=False)
+
+    def validate(self, data):
+        if not data.get("localizacao") and not data.get("filial"):
+            raise serializers.ValidationError(
+                "Informe a localização ou a filial do saldo."
+            )
+        return data
+
+
+class SaldoSerializer(serializers.Serializer):
+    localizacao = serializers.CharField()
+    filial = serializers.CharField(allow_null=True)
+    material = serializers.CharField()
+    desc_material = serializers.CharField(allow_null=True)
+    cor_material = serializers.CharField()
+    desc_cor_material = serializers.CharField(allow_null=True)
+    unidade = serializers.CharField(allow_null=True)
+    pecas = serializers.IntegerField()
+    quantidade = serializers.DecimalField(max_digits=18, decimal_places=3)
+    data_atualizacao = serializers.DateTimeField()
+
+
+class FiltroHistoricoSerializer(CursorMixin, serializers.Serializer):
+    usuario = serializers.CharField(max_length=25, required=False)
+    status = serializers.CharField(max_length=11, required=False)
+    origem = serializers.CharField(max_length=8, required=False)
+    destino = serializers.CharField(max_length=8, required=False)
+    filial = serializers.CharField(max_length=25, required=False)
+    data_de = serializers.DateField(required=False)
+    data_ate = serializers.DateField(required=False)
+    limite = serializers.IntegerField(min_value=1, max_value=200, default=50)
+    cursor = serializers.CharField(required=False)
+
+    SALT_CURSOR = "app_estoque_mp.historico"
+
+    @staticmethod
+    def chave_cursor(movimentacao):
+        # A chave de seek (data_inicio, movimentacao) da última movimentação da página
+        return [movimentacao["data_inicio"].isoformat(), movimentacao["movimentacao"]]
+
+    @staticmethod
+    def ler_cursor(chave):
+        data_inicio, movimentacao = chave
+        return datetime.fromisoformat(data_inicio), int(movimentacao)
+
+
+class HistoricoMovimentacoesSerializer(serializers.Serializer):
+    resultados = MovimentacaoSerializer(many=True)
+    proximo = serializers.CharField(allow_null=True)
+
+
+class AlteracoesSerializer(serializers.Serializer):
+    desde = serializers.CharField(
+        help_text="Token devolvido pela consulta anterior ou data/hora ISO 8601."
+    )
+
+    SALT_TOKEN = "app_estoque_mp.alteracoes"
+
+    @classmethod
+    def gerar_token(cls, versao):
+        """Token opaco (assinado) com a marca (ROWVERSION) da próxima consulta."""
+        return signing.dumps(versao, salt=cls.SALT_TOKEN)
+
+    @staticmethod
+    def prazo():
+        # Os registros de exclusão mais antigos que isso podem ter sido expurgados
+        return timedelta(days=getattr(settings, "ESTOQUE_ALTERACOES_DIAS", 30))
+
+    def validate_desde(self, valor):
+        # Retorna (data/hora, versão): um token traz a versão; um timestamp, a data
+        expirado = serializers.ValidationError(
+            "Marca anterior ao prazo do feed de alterações; refaça a carga completa."
+        )
+        try:
+            marca = signing.loads(valor, salt=self.SALT_TOKEN, max_age=self.prazo())
+        except signing.SignatureExpired:
+            raise expirado
+        except signing.BadSignature:
+            marca = None
+        else:
+            try:
+                return None, int(marca)
+            except (TypeError, ValueError):
+                raise serializers.ValidationError("Token inválido.")
+
+        data = parse_datetime(valor)
+        if data is None:
+            raise serializers.ValidationError(
+                "Informe um token ou uma data/hora ISO 8601."
+            )
+        if timezone.is_aware(data):
+            data = timezone.make_naive(data)
+        if data < timezone.make_naive(timezone.now()) - self.prazo():
+            raise expirado
+        return data, None
+
+
+class PecaExcluidaSerializer(serializers.Serializer):
+    movimentacao = serializers.IntegerField()
+    peca = serializers.CharField(max_length=6)
+
+
+class AlteracoesMovimentacoesSerializer(serializers.Serializer):
+    movimentacoes = MovimentacaoSerializer(many=True)
+    excluidas = serializers.ListField(child=serializers.IntegerField())
+    pecas_excluidas = PecaExcluidaSerializer(many=True)
+    token = serializers.CharField()
+
+
 class IncluiPecasSerializer(serializers.Serializer):
     data_modificacao = serializers.DateTimeField()
     pecas = PecaSerializer(many=True)
 
 
 class AtualizarMovimentacaoSerializer(serializers.Serializer):
-    origem = serializers.CharField(
+    origem = LocalizacaoField(
         required=False,
         max_length=8,
         help_text="Código da origem da movimentação. Deve ser diferente do destino.",
     )
-    destino = serializers.CharField(
+    destino = LocalizacaoField(
         required=False,
         max_length=8,
         help_text="Código do destino da movimentação. Deve ser diferente da origem.",
@@ -88,3 +391,179 @@ class AtualizarMovimentacaoSerializer(serializers.Serializer):
         required=True,
         help_text="Data e hora da última modificação na movimentação. Este campo é obrigatório.",
     )
+    assincrono = serializers.BooleanField(
+        required=False,
+        default=False,
+        help_text=(
+            "Com status True, agenda a finalização em vez de realocar as peças na "
+            "requisição: a movimentação fica 'Finalizando' e a resposta é 202. Com a "
+            "finalização assíncrona desabilitada no servidor, finaliza na requisição."
+        ),
+    )
+
+
+class FinalizacaoSerializer(serializers.Serializer):
+    movimentacao = serializers.IntegerField()
+    status = serializers.CharField(
+        help_text="Pendente, Processando, Erro, Falhou ou Concluida."
+    )
+    status_movimentacao = serializers.CharField(allow_null=True)
+    tentativas = serializers.IntegerField()
+    pecas_realocadas = serializers.IntegerField()
+    total_pecas = serializers.IntegerField(allow_null=True)
+    proxima_tentativa = serializers.DateTimeField()
+    erro = serializers.CharField(allow_null=True)
+    data_solicitacao = serializers.DateTimeField()
+    data_conclusao = serializers.DateTimeField(allow_null=True)
+
+
+class PecaRejeitadaSerializer(serializers.Serializer):
+    peca = serializers.CharField()
+    motivos = serializers.ListField(
+        child=serializers.CharField(),
+        help_text=(
+            "duplicada, nao_encontrada, fora_da_origem, divergente, ja_incluida "
+            "ou em_outra_movimentacao."
+        ),
+    )
+    detail = serializers.CharField()
+
+
+class PecasRejeitadasSerializer(serializers.Serializer):
+    detail = serializers.CharField()
+    rejeitadas = PecaRejeitadaSerializer(many=True)
+
+
+class ExcluiPecasSerializer(serializers.Serializer):
+    data_modificacao = serializers.DateTimeField()
+    pecas = serializers.ListField(
+        child=serializers.CharField(max_length=6), allow_empty=False
+    )
+
+
+class OperacaoSyncSerializer(serializers.Serializer):
+    # Serializer dos dados de cada tipo de operação
+    TIPOS = {
+        "criar_movimentacao": MovimentacaoSerializer,
+        "atualizar_movimentacao": AtualizarMovimentacaoSerializer,
+        "excluir_movimentacao": None,
+        "incluir_pecas": IncluiPecasSerializer,
+        "excluir_pecas": ExcluiPecasSerializer,
+    }
+
+    id_cliente = serializers.CharField(
+        max_length=64, help_text="Identificador da operação gerado no coletor."
+    )
+    tipo = serializers.ChoiceField(choices=list(TIPOS))
+    movimentacao = serializers.IntegerField(required=False)
+    mov_cliente = serializers.CharField(
+        max_length=64,
+        required=False,
+        help_text="id_cliente da operação criar_movimentacao que gerou a movimentação.",
+    )
+    dados = serializers.DictField(required=False, default=dict)
+
+    def validate(self, attrs):
+        if attrs["tipo"] != "criar_movimentacao" and not (
+            attrs.get("movimentacao") or attrs.get("mov_cliente")
+        ):
+            raise serializers.ValidationError(
+                "Informe movimentacao ou mov_cliente para este tipo de operação."
+            )
+        return attrs
+
+    @classmethod
+    def preparar(cls, operacao):
+        """
+        Operação validada pronta para MovimentacaoService.sincronizar: os dados passam
+        pelo serializer do tipo; se inválidos, seguem como erros no resultado dela.
+        """
+        operacao = dict(operacao)
+        serializer_class = cls.TIPOS[operacao["tipo"]]
+        if serializer_class is not None:
+            serializer = serializer_class(data=operacao["dados"])
+            if serializer.is_valid():
+                operacao["dados"] = serializer.validated_data
+            else:
+                operacao["erros"] = serializer.errors
+        return operacao
+
+
+class SincronizacaoSerializer(serializers.Serializer):
+    operacoes = OperacaoSyncSerializer(many=True, allow_empty=False, max_length=500)
+
+    def validate_operacoes(self, operacoes):
+        ids = [op["id_cliente"] for op in operacoes]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError("id_cliente repetido no lote.")
+        return operacoes
+
+
+class ResultadoSyncSerializer(serializers.Serializer):
+    id_cliente = serializers.CharField()
+    tipo = serializers.CharField()
+    status = serializers.IntegerField()
+    detail = serializers.CharField(allow_null=True)
+    movimentacao = serializers.IntegerField(allow_null=True)
+    repetida = serializers.BooleanField()
+
+
+class SincronizacaoRespostaSerializer(serializers.Serializer):
+    resultados = ResultadoSyncSerializer(many=True)
+    mapeamento = serializers.DictField(
+        child=serializers.IntegerField(),
+        help_text="id_cliente de cada criar_movimentacao -> movimentação no servidor.",
+    )
+
+
+def _como_texto(valor):
+    return valor if valor.__class__ is str else str(valor)
+
+
+class RepresentacaoRapida:
+    """
+    Saída equivalente ao to_representation de um Serializer somente leitura, sem a
+    maquinaria genérica de campos do DRF: o conversor de cada campo é resolvido uma
+    única vez por classe. Os textos devem chegar já aparados, o que é feito no
+    mapeamento das linhas (kingjoe.db com aparar=True).
+    """
+
+    def __init__(self, serializer_class):
+        campos = [
+            (nome, campo)
+            for nome, campo in serializer_class().fields.items()
+            if not campo.write_only
+        ]
+        self._nomes = tuple(nome for nome, _ in campos)
+        self._fontes = tuple(campo.source for _, campo in campos)
+        self._conversores = tuple(self._conversor(campo) for _, campo in campos)
+
+    @classmethod
+    def _conversor(cls, campo):
+        if isinstance(campo, serializers.ListSerializer):
+            filho = cls(type(campo.child))
+            return filho.lista
+        if isinstance(campo, serializers.BaseSerializer):
+            return cls(type(campo))
+        if isinstance(campo, serializers.CharField):
+            return _como_texto
+        return campo.to_representation
+
+    def __call__(self, instancia):
+        if isinstance(instancia, dict):
+            valores = [instancia[fonte] for fonte in self._fontes]
+        else:
+            valores = [getattr(instancia, fonte) for fonte in self._fontes]
+
+        return {
+            nome: None if valor is None else conversor(valor)
+            for nome, conversor, valor in zip(self._nomes, self._conversores, valores)
+        }
+
+    def lista(self, instancias):
+        return [self(instancia) for instancia in instancias]
+
+
+representar_localizacao = RepresentacaoRapida(LocalizacoesSerializer)
+representar_peca = RepresentacaoRapida(PecaSerializer)
+representar_movimentacao = RepresentacaoRapida(MovimentacaoSerializer)
@@ -0,0 +1,1506 @@
+from collections import deque
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+import json
+import logging
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+
+from kingjoe.db import linhas, primeira, todas
+from .catalogo import CAMPOS_DESCRICAO, catalogo
+from .localizacoes import chave, localizacoes
+
+
+# O SQL Server aceita no máximo 2100 parâmetros por comando
+LIMITE_PARAMETROS = 2100
+
+# Colunas do cabeçalho que as consultas de carregar_movimentacoes devem retornar
+SQL_CABECALHO_MOVIMENTACAO = """
+    m.movimentacao,
+    m.data_inicio,
+    m.data_modificacao,
+    m.status,
+    m.usuario,
+    m.origem,
+    m.destino,
+    m.total_pecas
+"""
+
+# Movimentações e peças ativas e arquivadas (arquivar_movimentacoes), para as consultas
+# de histórico. Uma movimentação está em só uma das tabelas, então UNION ALL basta.
+# As arquivadas não mudam mais e não têm VERSAO (ROWVERSION): ela vem nula
+SQL_MOVIMENTACOES_COM_ARQUIVO = """(
+    SELECT 
+        movimentacao, data_inicio, data_modificacao, status,
+        usuario, origem, destino, total_pecas,
+        CAST(versao AS BIGINT) AS versao
+    FROM dbo.KING_ESTOQUE_MAT_MOV
+    UNION ALL
+    SELECT 
+        movimentacao, data_inicio, data_modificacao, status,
+        usuario, origem, destino, total_pecas,
+        CAST(NULL AS BIGINT)
+    FROM dbo.KING_ESTOQUE_MAT_MOV_ARQ
+)"""
+
+SQL_PECAS_COM_ARQUIVO = """(
+    SELECT 
+        movimentacao, peca, partida, material, cor_material, unidade, quantidade
+    FROM dbo.KING_ESTOQUE_MAT_MOV_PECA
+    UNION ALL
+    SELECT 
+        movimentacao, peca, partida, material, cor_material, unidade, quantidade
+    FROM dbo.KING_ESTOQUE_MAT_MOV_PECA_ARQ
+)"""
+
+# Condição das alterações protegidas: a movimentação não pode estar finalizada nem em
+# finalização. Vai no próprio UPDATE/DELETE, sem uma leitura prévia do status
+SQL_ALTERAVEL = "ISNULL(status, '') NOT IN ('Finalizada', 'Finalizando')"
+
+# Fim dos lotes de alteração protegidos (incluir/excluir peças): diz se o comando
+# protegido alterou a movimentação e, se não, o status dela, sem outra consulta
+SQL_RESULTADO_ALTERACAO = """
+    SELECT @alterada AS alterada, m.movimentacao, m.status
+    FROM (SELECT 1 AS um) u
+    LEFT JOIN KING_ESTOQUE_MAT_MOV m ON m.movimentacao = @movimentacao;
+"""
+
+# Atributos do cabeçalho preenchidos depois da consulta
+CAMPOS_CABECALHO = ("filial_origem", "filial_destino", "pecas")
+
+COLUNAS_MOV_PECA = (
+    "movimentacao",
+    "peca",
+    "partida",
+    "material",
+    "cor_material",
+    "unidade",
+    "quantidade",
+)
+
+# Inserção das peças de uma movimentação (@movimentacao) em um único comando: as
+# peças seguem como um array JSON (MovimentacaoService._pecas_json) em um único
+# parâmetro, sem o limite de 2100 parâmetros do SQL Server
+SQL_INSERIR_PECAS = f"""
+    INSERT INTO KING_ESTOQUE_MAT_MOV_PECA ({', '.join(COLUNAS_MOV_PECA)})
+    SELECT 
+        @movimentacao, j.peca, j.partida, j.material,
+        j.cor_material, j.unidade, j.quantidade
+    FROM OPENJSON(%s) WITH (
+        peca VARCHAR(6) '$.peca',
+        partida VARCHAR(6) '$.partida',
+        material VARCHAR(11) '$.material',
+        cor_material VARCHAR(10) '$.cor_material',
+        unidade VARCHAR(5) '$.unidade',
+        quantidade DECIMAL(18, 3) '$.quantidade'
+    ) j;
+"""
+
+# Aplica no saldo por localização as peças movidas de @movidas (de, para, material,
+# cor_material, qtde): sai da localização de origem e entra na de destino. Só peças
+# com quantidade contam, como na reconstrução do saldo. HOLDLOCK trava também as
+# chaves ainda ausentes: duas finalizações que criam a mesma linha não disputam o INSERT
+SQL_APLICAR_SALDO = """
+    MERGE KING_ESTOQUE_MAT_SALDO WITH (HOLDLOCK) AS s
+    USING (
+        SELECT localizacao, material, cor_material,
+               SUM(pecas) AS pecas, SUM(quantidade) AS quantidade
+        FROM (
+            SELECT de AS localizacao, material, cor_material,
+                   -1 AS pecas, -qtde AS quantidade
+            FROM @movidas WHERE de IS NOT NULL AND qtde > 0
+            UNION ALL
+            SELECT para, material, cor_material, 1, qtde
+            FROM @movidas WHERE para IS NOT NULL AND qtde > 0
+        ) diferencas
+        GROUP BY localizacao, material, cor_material
+    ) AS d
+    ON s.localizacao = d.localizacao
+       AND s.material = d.material
+       AND s.cor_material = d.cor_material
+    WHEN MATCHED AND s.pecas + d.pecas <= 0 THEN
+        DELETE
+    WHEN MATCHED THEN
+        UPDATE SET pecas = s.pecas + d.pecas,
+                   quantidade = s.quantidade + d.quantidade,
+                   data_atualizacao = GETDATE()
+    WHEN NOT MATCHED BY TARGET AND d.pecas > 0 THEN
+        INSERT (localizacao, material, cor_material, pecas, quantidade, data_atualizacao)
+        VALUES (d.localizacao, d.material, d.cor_material, d.pecas, d.quantidade, GETDATE());
+"""
+
+# Dados da peça enviados pelo coletor que precisam conferir com ESTOQUE_MAT_PECA
+COLUNAS_CONFERIDAS = ("material", "cor_material", "partida", "quantidade")
+
+
+def _normalizar(valor):
+    if isinstance(valor, str):
+        return valor.strip()
+    if isinstance(valor, (int, float)):
+        return Decimal(str(valor))
+    return valor
+
+
+class MovimentacaoService:
+
+    def inserir_pecas(self, cursor, movimentacao, pecas):
+        """
+        Insere as peças da movimentação em KING_ESTOQUE_MAT_MOV_PECA em um único
+        comando (SQL_INSERIR_PECAS), o mesmo usado no lote de incluir_pecas.
+        """
+        if not pecas:
+            return
+
+        cursor.execute(
+            f"""
+            DECLARE @movimentacao INT = %s;
+            {SQL_INSERIR_PECAS}
+            """,
+            [movimentacao, self._pecas_json(pecas)],
+        )
+
+    def _pecas_json(self, pecas):
+        return json.dumps(
+            [
+                {
+                    "peca": peca["peca"],
+                    "partida": peca.get("partida"),
+                    "material": peca["material"],
+                    "cor_material": peca["cor_material"],
+                    "unidade": peca["unidade"],
+                    "quantidade": str(peca["quantidade"]),
+                }
+                for peca in pecas
+            ]
+        )
+
+    def carregar_movimentacoes(self, cursor, query, params):
+        """
+        Carrega movimentações com suas peças em duas consultas: a dos cabeçalhos
+        (query, que seleciona SQL_CABECALHO_MOVIMENTACAO) e uma única consulta das
+        peças de todas elas. Cada cabeçalho é lido e montado uma única vez.
+        """
+        return list(self.iterar_movimentacoes(cursor, query, params))
+
+    def iterar_movimentacoes(self, cursor, query, params):
+        """
+        Mesmo resultado de carregar_movimentacoes, mas gera cada movimentação assim
+        que suas peças terminam de ser lidas (as peças chegam na ordem dos cabeçalhos).
+        Depois de gerada, a movimentação não fica referenciada aqui.
+        """
+        pendentes = deque(self.carregar_cabecalhos(cursor, query, params))
+        ids = [mov["movimentacao"] for mov in pendentes]
+        atual = None
+
+        for movimentacao, peca in self.carregar_pecas(cursor, ids):
+            while atual is None or atual["movimentacao"] != movimentacao:
+                if atual is not None:
+                    yield atual
+                atual = pendentes.popleft()
+            atual["pecas"].append(peca)
+
+        if atual is not None:
+            yield atual
+        while pendentes:
+            yield pendentes.popleft()
+
+    def anexar_pecas(self, cursor, movimentacoes, arquivo=False):
+        por_id = {mov["movimentacao"]: mov for mov in movimentacoes}
+        for movimentacao, peca in self.carregar_pecas(
+            cursor, list(por_id), arquivo=arquivo
+        ):
+            por_id[movimentacao]["pecas"].append(peca)
+
+    def carregar_cabecalhos(self, cursor, query, params):
+        cursor.execute(query, params)
+        movimentacoes = todas(cursor, extras=CAMPOS_CABECALHO, aparar=True)
+        for mov in movimentacoes:
+            mov.filial_origem = localizacoes.filial(mov.origem)
+            mov.filial_destino = localizacoes.filial(mov.destino)
+            mov.pecas = []
+        return movimentacoes
+
+    def carregar_pecas(self, cursor, movimentacoes, tamanho_bloco=500, arquivo=False):
+        """
+        Gera (movimentacao, peça) para as movimentações informadas, na mesma ordem
+        da lista. Os ids seguem como um array JSON em um único parâmetro. Com
+        arquivo, as peças das movimentações arquivadas também são lidas.
+        """
+        if not movimentacoes:
+            return
+
+        tabela = SQL_PECAS_COM_ARQUIVO if arquivo else "dbo.KING_ESTOQUE_MAT_MOV_PECA"
+        cursor.execute(
+            f"""
+            SELECT 
+                mp.movimentacao,
+                mp.peca,
+                mp.partida,
+                mp.material,
+                mp.cor_material,
+                mp.unidade,
+                mp.quantidade,
+                ep.localizacao, 
+                ep.filial
+            FROM 
+                OPENJSON(%s) ids
+            JOIN 
+                {tabela} mp ON mp.movimentacao = CAST(ids.value AS INT)
+            LEFT JOIN 
+                ESTOQUE_MAT_PECA ep ON ep.PECA = mp.PECA
+            ORDER BY 
+                CAST(ids.[key] AS INT)
+            """,
+            [json.dumps(movimentacoes)],
+        )
+        for peca in linhas(cursor, CAMPOS_DESCRICAO, tamanho_bloco, aparar=True):
+            catalogo.descrever(peca)
+            yield peca.movimentacao, peca
+
+    def listar_historico(self, cursor, filtros, limite, apos=None):
+        """
+        Página do histórico de movimentações, da mais recente para a mais antiga.
+        A paginação é por seek em (data_inicio, movimentacao): apos é a chave do
+        último item da página anterior. Retorna (movimentações, tem_mais).
+        """
+        condicoes = []
+        params = []
+
+        for campo in ("usuario", "status", "origem", "destino"):
+            if filtros.get(campo):
+                condicoes.append(f"m.{campo} = %s")
+                params.append(filtros[campo])
+
+        if filtros.get("filial"):
+            condicoes.append(
+                """(
+                    m.origem IN (SELECT localizacao FROM MATERIAIS_LOCALIZA WHERE filial = %s)
+                    OR m.destino IN (SELECT localizacao FROM MATERIAIS_LOCALIZA WHERE filial = %s)
+                )"""
+            )
+            params.extend([filtros["filial"], filtros["filial"]])
+
+        if filtros.get("data_de"):
+            condicoes.append("m.data_inicio >= %s")
+            params.append(datetime.combine(filtros["data_de"], time.min))
+
+        if filtros.get("data_ate"):
+            condicoes.append("m.data_inicio < %s")
+            params.append(
+                datetime.combine(filtros["data_ate"] + timedelta(days=1), time.min)
+            )
+
+        if apos:
+            data_inicio, movimentacao = apos
+            condicoes.append(
+                "(m.data_inicio < %s OR (m.data_inicio = %s AND m.movimentacao < %s))"
+            )
+            params.extend([data_inicio, data_inicio, movimentacao])
+
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        query = f"""
+            SELECT TOP (%s) {SQL_CABECALHO_MOVIMENTACAO}
+            FROM 
+                {SQL_MOVIMENTACOES_COM_ARQUIVO} m
+            {where}
+            ORDER BY 
+                m.data_inicio DESC, m.movimentacao DESC
+        """
+
+        # Um item a mais indica se existe a próxima página
+        movimentacoes = self.carregar_cabecalhos(cursor, query, [limite + 1] + params)
+        tem_mais = len(movimentacoes) > limite
+        movimentacoes = movimentacoes[:limite]
+
+        self.anexar_pecas(cursor, movimentacoes, arquivo=True)
+        return movimentacoes, tem_mais
+
+    def listar_alteracoes(self, cursor, usuario, desde=None, versao=None):
+        """
+        Movimentações do usuário e exclusões registradas desde a marca anterior.
+
+        A marca é a ROWVERSION (VERSAO), atribuída pelo servidor a cada alteração,
+        e não a data_modificacao enviada pelo coletor. A consulta para antes de
+        MIN_ACTIVE_ROWVERSION(): versões a partir dela podem ser de transações ainda
+        abertas, que confirmariam depois de uma marca já entregue. Sem versao (marca
+        vinda de um timestamp), parte das alterações posteriores a desde.
+        Retorna (movimentações, exclusões, marca para a próxima consulta).
+        """
+        cursor.execute("SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) AS ate")
+        ate = primeira(cursor).ate
+
+        if versao is not None:
+            inicio_mov = "m.versao >= CAST(CAST(%s AS BIGINT) AS BINARY(8))"
+            inicio_exc = "versao >= CAST(CAST(%s AS BIGINT) AS BINARY(8))"
+            inicio = versao
+        else:
+            inicio_mov = "m.data_modificacao > %s"
+            inicio_exc = "data_exclusao > %s"
+            inicio = desde
+
+        movimentacoes = self.carregar_movimentacoes(
+            cursor,
+            f"""
+            SELECT {SQL_CABECALHO_MOVIMENTACAO}
+            FROM 
+                dbo.KING_ESTOQUE_MAT_MOV m
+            WHERE 
+                m.usuario = %s
+                AND {inicio_mov}
+                AND m.versao < CAST(CAST(%s AS BIGINT) AS BINARY(8))
+            ORDER BY 
+                m.versao
+            """,
+            [usuario, inicio, ate],
+        )
+
+        cursor.execute(
+            f"""
+            SELECT movimentacao, peca, data_exclusao
+            FROM dbo.KING_ESTOQUE_MAT_MOV_EXCLUSAO
+            WHERE usuario = %s
+              AND {inicio_exc}
+              AND versao < CAST(CAST(%s AS BIGINT) AS BINARY(8))
+            ORDER BY versao
+            """,
+            [usuario, inicio, ate],
+        )
+        exclusoes = todas(cursor, aparar=True)
+
+        return movimentacoes, exclusoes, ate
+
+    # Alterações de movimentações. Cada método recebe o cursor da transação de quem
+    # chama (a view ou a sincronização em lote) e retorna (status HTTP, mensagem, dados).
+
+    def _falha_alteracao(self, cursor, movimentacao, acao):
+        """
+        Motivo de um comando protegido por SQL_ALTERAVEL não ter alterado nenhuma
+        linha. Só é consultado no caminho de erro.
+        """
+        cursor.execute(
+            "SELECT movimentacao, status FROM KING_ESTOQUE_MAT_MOV WHERE movimentacao = %s",
+            [movimentacao],
+        )
+        return self._motivo_falha(primeira(cursor, aparar=True), acao)
+
+    def _motivo_falha(self, atual, acao):
+        if atual is None or atual.movimentacao is None:
+            return (404, "Movimentação não encontrada.", None)
+        if atual.status == "Finalizada":
+            return (
+                400,
+                f"A movimentação já está finalizada e não pode ser {acao}.",
+                None,
+            )
+        if atual.status == "Finalizando":
+            return (
+                400,
+                f"A movimentação está sendo finalizada e não pode ser {acao}.",
+                None,
+            )
+        return (409, "A movimentação foi alterada durante a operação.", None)
+
+    def criar_movimentacao(self, cursor, dados):
+        rejeitadas = self._validar_pecas(
+            cursor, dados.get("pecas", []), origem=dados["origem"]
+        )
+        if rejeitadas:
+            return (400, "Há peças rejeitadas na movimentação.", rejeitadas)
+
+        # Inserir a movimentação e obter o ID usando OUTPUT INSERTED
+        cursor.execute(
+            """
+            INSERT INTO KING_ESTOQUE_MAT_MOV (
+                data_inicio, data_modificacao, status, usuario,
+                origem, destino, total_pecas
+            ) 
+            OUTPUT INSERTED.MOVIMENTACAO
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """,
+            [
+                dados["data_inicio"],
+                dados["data_modificacao"],
+                dados["status"],
+                dados["usuario"],
+                dados["origem"],
+                dados.get("destino"),
+                dados["total_pecas"],
+            ],
+        )
+        movimentacao = primeira(cursor).movimentacao
+
+        # Insere os pecas relacionados à movimentação
+        self.inserir_pecas(cursor, movimentacao, dados.get("pecas", []))
+
+        return (201, "Movimentação criada com sucesso.", movimentacao)
+
+    def criar_movimentacao_palete(self, cursor, dados):
+        """
+        Cria uma movimentação com todas as peças em estoque na origem (ou só as do
+        material informado) em um único lote: o cabeçalho e um INSERT ... SELECT de
+        ESTOQUE_MAT_PECA em KING_ESTOQUE_MAT_MOV_PECA, sem ler peça por peça. Peças já
+        incluídas em outra movimentação aberta ficam de fora; como em _validar_pecas,
+        as faixas de KING_ESTOQUE_MAT_MOV_PECA lidas ficam travadas (UPDLOCK,
+        HOLDLOCK) até o fim da transação, para duas criações simultâneas não levarem
+        a mesma peça. Com finalizar, a movimentação segue pela finalização normal
+        (síncrona ou agendada).
+        """
+        cursor.execute(
+            f"""
+            SET NOCOUNT ON;
+
+            DECLARE @pecas TABLE (
+                peca VARCHAR(6) PRIMARY KEY,
+                partida VARCHAR(6),
+                material VARCHAR(11),
+                cor_material VARCHAR(10),
+                unidade VARCHAR(5),
+                quantidade DECIMAL(18, 3)
+            );
+            DECLARE @movimentacao TABLE (movimentacao INT);
+
+            INSERT INTO @pecas
+            SELECT peca, partida, material, cor_material, unidade, quantidade
+            FROM (
+                SELECT 
+                    e.peca,
+                    e.partida,
+                    e.material,
+                    e.cor_material,
+                    mt.unid_estoque AS unidade,
+                    e.qtde AS quantidade,
+                    ROW_NUMBER() OVER (PARTITION BY e.peca ORDER BY e.peca) AS ordem
+                FROM 
+                    ESTOQUE_MAT_PECA e
+                LEFT JOIN 
+                    MATERIAIS mt ON mt.material = e.material
+                WHERE 
+                    e.localizacao = %s
+                AND e.PECA IS NOT NULL 
+                AND e.PECA <> '' 
+                AND e.qtde > 0
+                AND (%s IS NULL OR e.material = %s)
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM KING_ESTOQUE_MAT_MOV_PECA mp WITH (UPDLOCK, HOLDLOCK)
+                    JOIN KING_ESTOQUE_MAT_MOV m ON m.movimentacao = mp.movimentacao
+                    WHERE mp.peca = e.peca AND ISNULL(m.status, '') <> 'Finalizada'
+                )
+            ) p
+            WHERE ordem = 1;
+
+            IF @@ROWCOUNT > 0
+            BEGIN
+                INSERT INTO KING_ESTOQUE_MAT_MOV (
+                    data_inicio, data_modificacao, status, usuario,
+                    origem, destino, total_pecas
+                )
+                OUTPUT INSERTED.MOVIMENTACAO INTO @movimentacao
+                SELECT %s, %s, 'Andamento', %s, %s, %s, COUNT(*)
+                FROM @pecas;
+
+                INSERT INTO KING_ESTOQUE_MAT_MOV_PECA (
+                    {', '.join(COLUNAS_MOV_PECA)}
+                )
+                SELECT 
+                    m.movimentacao, p.peca, p.partida, p.material,
+                    p.cor_material, p.unidade, p.quantidade
+                FROM @pecas p
+                CROSS JOIN @movimentacao m;
+            END
+
+            SELECT 
+                (SELECT movimentacao FROM @movimentacao) AS movimentacao,
+                (SELECT COUNT(*) FROM @pecas) AS total_pecas;
+            """,
+            [
+                dados["origem"],
+                dados.get("material"),
+                dados.get("material"),
+                dados["data_inicio"],
+                dados["data_modificacao"],
+                dados["usuario"],
+                dados["origem"],
+                dados["destino"],
+            ],
+        )
+        criada = primeira(cursor)
+        if criada.movimentacao is None:
+            return (400, "Nenhuma peça disponível na origem.", None)
+
+        codigo, mensagem = 201, "Movimentação criada com sucesso."
+        status = "Andamento"
+        if dados.get("finalizar"):
+            # Recém-criada na mesma transação: a finalização não tem como ser recusada
+            codigo, mensagem, _ = self.atualizar_movimentacao(
+                cursor,
+                criada.movimentacao,
+                {
+                    "status": True,
+                    "assincrono": dados.get("assincrono"),
+                    "data_modificacao": dados["data_modificacao"],
+                },
+            )
+            if codigo == 202:
+                mensagem = "Movimentação criada e finalização agendada."
+                status = "Finalizando"
+            else:
+                codigo, mensagem = 201, "Movimentação criada e finalizada."
+                status = "Finalizada"
+
+        return (
+            codigo,
+            mensagem,
+            {
+                "movimentacao": criada.movimentacao,
+                "total_pecas": criada.total_pecas,
+                "status": status,
+            },
+        )
+
+    def _validar_pecas(self, cursor, pecas, origem=None, movimentacao=None):
+        """
+        Confere, em uma única consulta, as peças que vão entrar em uma movimentação:
+        se existem em ESTOQUE_MAT_PECA, se estão na origem (a informada ou a da
+        movimentação), se os dados enviados conferem com o estoque e se a peça já não
+        está em uma movimentação aberta. Retorna a lista de rejeições, uma por peça.
+
+        Os locks da consulta valem até o fim da transação de quem chama: o cabeçalho
+        da movimentação (UPDLOCK), as peças lidas do estoque (HOLDLOCK) e as faixas
+        de KING_ESTOQUE_MAT_MOV_PECA das peças (UPDLOCK, HOLDLOCK). Assim, a mesma
+        peça validada em duas transações é incluída por uma e rejeitada na outra,
+        e nada do que foi conferido muda antes da inserção.
+        """
+        if not pecas or not getattr(settings, "ESTOQUE_VALIDAR_PECAS", True):
+            return []
+
+        codigos = list(dict.fromkeys(peca["peca"] for peca in pecas))
+        cursor.execute(
+            """
+            SELECT 
+                j.peca,
+                e.peca AS estoque,
+                e.localizacao,
+                e.material,
+                e.cor_material,
+                e.partida,
+                e.qtde AS quantidade,
+                o.origem,
+                a.movimentacao AS em_movimentacao
+            FROM 
+                OPENJSON(%s) WITH (peca VARCHAR(6) '$') j
+            CROSS JOIN (
+                SELECT COALESCE(
+                    %s,
+                    (
+                        SELECT origem
+                        FROM KING_ESTOQUE_MAT_MOV WITH (UPDLOCK, ROWLOCK)
+                        WHERE movimentacao = %s
+                    )
+                ) AS origem
+            ) o
+            OUTER APPLY (
+                SELECT TOP (1) ep.*
+                FROM ESTOQUE_MAT_PECA ep WITH (HOLDLOCK)
+                WHERE ep.peca = j.peca AND ep.qtde > 0
+                ORDER BY CASE WHEN ep.localizacao = o.origem THEN 0 ELSE 1 END
+            ) e
+            OUTER APPLY (
+                SELECT TOP (1) mp.movimentacao
+                FROM KING_ESTOQUE_MAT_MOV_PECA mp WITH (UPDLOCK, HOLDLOCK)
+                JOIN KING_ESTOQUE_MAT_MOV m ON m.movimentacao = mp.movimentacao
+                WHERE mp.peca = j.peca AND ISNULL(m.status, '') <> 'Finalizada'
+                ORDER BY CASE WHEN mp.movimentacao = %s THEN 0 ELSE 1 END
+            ) a
+            """,
+            [json.dumps(codigos), origem, movimentacao, movimentacao],
+        )
+        estoque = {linha.peca: linha for linha in linhas(cursor, aparar=True)}
+
+        rejeitadas = []
+        vistas = set()
+        for peca in pecas:
+            motivos = self._motivos_rejeicao(
+                peca, estoque.get(peca["peca"]), movimentacao, peca["peca"] in vistas
+            )
+            vistas.add(peca["peca"])
+            if motivos:
+                rejeitadas.append(
+                    {
+                        "peca": peca["peca"],
+                        "motivos": [codigo for codigo, _ in motivos],
+                        "detail": " ".join(detalhe for _, detalhe in motivos),
+                    }
+                )
+        return rejeitadas
+
+    def _motivos_rejeicao(self, peca, estoque, movimentacao, repetida):
+        motivos = []
+        if repetida:
+            motivos.append(("duplicada", "Peça repetida na lista."))
+
+        if estoque is None or estoque.estoque is None:
+            motivos.append(("nao_encontrada", "Peça não encontrada no estoque."))
+            return motivos
+
+        # Sem origem (movimentação inexistente), a própria alteração responde 404. A
+        # comparação é a do banco, sem distinção de maiúsculas
+        if estoque.origem is not None and chave(estoque.localizacao) != chave(
+            estoque.origem
+        ):
+            motivos.append(
+                (
+                    "fora_da_origem",
+                    f"Peça está em '{estoque.localizacao}', não na origem "
+                    f"'{estoque.origem}'.",
+                )
+            )
+
+        divergentes = [
+            campo
+            for campo in COLUNAS_CONFERIDAS
+            if peca.get(campo) not in (None, "")
+            and _normalizar(peca[campo]) != _normalizar(estoque[campo])
+        ]
+        if divergentes:
+            motivos.append(
+                (
+                    "divergente",
+                    f"Dados diferentes do estoque: {', '.join(divergentes)}.",
+                )
+            )
+
+        if estoque.em_movimentacao is not None:
+            if estoque.em_movimentacao == movimentacao:
+                motivos.append(("ja_incluida", "Peça já está nesta movimentação."))
+            else:
+                motivos.append(
+                    (
+                        "em_outra_movimentacao",
+                        f"Peça já está na movimentação aberta {estoque.em_movimentacao}.",
+                    )
+                )
+        return motivos
+
+    def atualizar_movimentacao(self, cursor, movimentacao, dados):
+        # Preparando os dados para atualização
+        fields_to_update = []
+        params = []
+
+        if "origem" in dados:
+            fields_to_update.append("origem = %s")
+            params.append(dados["origem"])
+        if "destino" in dados:
+            fields_to_update.append("destino = %s")
+            params.append(dados["destino"])
+
+        finalizar = dados.get("status") is True
+        # Sem o processar_finalizacoes em execução, a movimentação ficaria 'Finalizando'
+        # para sempre: a finalização agendada só vale se estiver habilitada
+        assincrono = (
+            finalizar
+            and dados.get("assincrono")
+            and getattr(settings, "ESTOQUE_FINALIZACAO_ASSINCRONA", False)
+        )
+        if finalizar:
+            fields_to_update.append("status = %s")
+            params.append("Finalizando" if assincrono else "Finalizada")
+
+        # A data_modificacao deve sempre estar presente e ser atualizada
+        fields_to_update.append("data_modificacao = %s")
+        params.append(dados["data_modificacao"])
+
+        # Na finalização assíncrona, o mesmo comando coloca a movimentação na fila
+        fila = ""
+        if assincrono:
+            fila = (
+                "OUTPUT INSERTED.movimentacao "
+                "INTO KING_ESTOQUE_MAT_MOV_FINALIZACAO (movimentacao)"
+            )
+        cursor.execute(
+            f"""
+            UPDATE KING_ESTOQUE_MAT_MOV
+            SET {', '.join(fields_to_update)}
+            {fila}
+            OUTPUT INSERTED.origem
+            WHERE movimentacao = %s AND {SQL_ALTERAVEL}
+            """,
+            params + [movimentacao],
+        )
+        alterada = primeira(cursor, aparar=True)
+        if alterada is None:
+            return self._falha_alteracao(cursor, movimentacao, "alterada")
+
+        # Os dados de retorno são a origem gravada: as peças dela saem na finalização
+        if assincrono:
+            # A realocação fica para o processar_finalizacoes
+            return (202, "Finalização da movimentação agendada.", alterada.origem)
+
+        if finalizar:
+            # Depois do cabeçalho, para as peças irem para o destino já atualizado
+            self._realocar_pecas(cursor, movimentacao)
+
+        return (200, "Movimentação atualizada com sucesso.", alterada.origem)
+
+    def tamanho_lote_realocacao(self):
+        return max(1, getattr(settings, "ESTOQUE_LOTE_REALOCACAO", 500))
+
+    def realocar_lote(self, cursor, movimentacao, tamanho):
+        """
+        Move para o destino da movimentação até tamanho peças que ainda não estão
+        nele e retorna quantas moveu. Comandos limitados mantêm o número de locks
+        abaixo do limite de escalonamento para lock de tabela; como só peças fora
+        do destino são alteradas, repetir o comando continua de onde parou.
+
+        No mesmo lote, as peças movidas (OUTPUT da atualização) viram as diferenças
+        aplicadas por MERGE no saldo por localização (KING_ESTOQUE_MAT_SALDO).
+        """
+        cursor.execute(
+            f"""
+            SET NOCOUNT ON;
+
+            DECLARE @movidas TABLE (
+                de VARCHAR(8),
+                para VARCHAR(8),
+                material VARCHAR(11),
+                cor_material VARCHAR(10),
+                qtde DECIMAL(18, 3)
+            );
+
+            UPDATE TOP (%s) ep
+            SET localizacao = mv.destino
+            OUTPUT 
+                DELETED.localizacao, INSERTED.localizacao,
+                INSERTED.material, INSERTED.cor_material, INSERTED.qtde
+            INTO @movidas
+            FROM ESTOQUE_MAT_PECA ep
+            INNER JOIN KING_ESTOQUE_MAT_MOV_PECA mp ON ep.peca = mp.PECA
+            INNER JOIN KING_ESTOQUE_MAT_MOV mv ON mp.MOVIMENTACAO = mv.MOVIMENTACAO
+            WHERE mv.movimentacao = %s
+              AND ISNULL(ep.localizacao, '') <> ISNULL(mv.destino, '');
+
+            {SQL_APLICAR_SALDO}
+
+            SELECT COUNT(*) AS realocadas FROM @movidas;
+            """,
+            [tamanho, movimentacao],
+        )
+        return primeira(cursor).realocadas
+
+    def _realocar_pecas(self, cursor, movimentacao):
+        # Atualizar a localizacao em ESTOQUE_MAT_PECA para todas as peças associadas à movimentação
+        tamanho = self.tamanho_lote_realocacao()
+        try:
+            while self.realocar_lote(cursor, movimentacao, tamanho) == tamanho:
+                pass
+            logging.info(f"ScanMove atualizado para movimentacao {movimentacao}")
+        except Exception as e:
+            logging.error(f"Erro ao atualizar o ScanMove: {str(e)}")
+            raise
+
+    def excluir_movimentacao(self, cursor, movimentacao):
+        # Exclui a movimentação (pecas relacionados serão excluídos automaticamente)
+        # e registra a exclusão para o feed de alterações do dono. O resultado vem do
+        # OUTPUT, e não do rowcount: depois de um lote com SET NOCOUNT ON na mesma
+        # conexão, o pyodbc informa -1
+        cursor.execute(
+            f"""
+            DELETE FROM KING_ESTOQUE_MAT_MOV
+            OUTPUT DELETED.movimentacao, DELETED.usuario
+            INTO KING_ESTOQUE_MAT_MOV_EXCLUSAO (movimentacao, usuario)
+            OUTPUT DELETED.movimentacao
+            WHERE movimentacao = %s AND {SQL_ALTERAVEL}
+            """,
+            [movimentacao],
+        )
+        if primeira(cursor) is None:
+            return self._falha_alteracao(cursor, movimentacao, "excluída")
+
+        return (204, "Movimentação excluída com sucesso.", None)
+
+    def incluir_pecas(self, cursor, movimentacao, pecas, data_modificacao):
+        # Antes de qualquer escrita: uma rejeição não deixa nada para desfazer. A
+        # validação já trava o cabeçalho e as peças até o fim da transação, então o
+        # que ela conferiu continua valendo no lote abaixo
+        rejeitadas = self._validar_pecas(cursor, pecas, movimentacao=movimentacao)
+        if rejeitadas:
+            return (400, "Há peças rejeitadas na movimentação.", rejeitadas)
+
+        # Um lote: a data_modificacao só é gravada se a movimentação ainda puder ser
+        # alterada, e as peças só entram se ela foi. O lock de escrita no cabeçalho
+        # vale até o fim da transação. As peças entram por SQL_INSERIR_PECAS
+        cursor.execute(
+            f"""
+            SET NOCOUNT ON;
+
+            DECLARE @movimentacao INT = %s;
+            DECLARE @alterada BIT = 0;
+
+            UPDATE KING_ESTOQUE_MAT_MOV
+            SET data_modificacao = %s
+            WHERE movimentacao = @movimentacao AND {SQL_ALTERAVEL};
+
+            IF @@ROWCOUNT > 0
+            BEGIN
+                SET @alterada = 1;
+
+                {SQL_INSERIR_PECAS}
+            END
+
+            {SQL_RESULTADO_ALTERACAO}
+            """,
+            [movimentacao, data_modificacao, self._pecas_json(pecas)],
+        )
+        resultado = primeira(cursor, aparar=True)
+        if not resultado.alterada:
+            return self._motivo_falha(resultado, "alterada")
+
+        return (201, "Peças incluídas com sucesso.", None)
+
+    def excluir_pecas(self, cursor, movimentacao, pecas, data_modificacao):
+        # Um lote: grava a data_modificacao se a movimentação ainda puder ser
+        # alterada e só então deleta as peças, registrando cada exclusão com o
+        # usuário dono. A lista segue como um array JSON em um único parâmetro
+        cursor.execute(
+            f"""
+            SET NOCOUNT ON;
+
+            DECLARE @movimentacao INT = %s;
+            DECLARE @alterada BIT = 0;
+            DECLARE @usuario VARCHAR(25);
+
+            UPDATE KING_ESTOQUE_MAT_MOV
+            SET data_modificacao = %s, @usuario = usuario
+            WHERE movimentacao = @movimentacao AND {SQL_ALTERAVEL};
+
+            IF @@ROWCOUNT > 0
+            BEGIN
+                SET @alterada = 1;
+
+                DELETE mp
+                OUTPUT DELETED.movimentacao, DELETED.peca, @usuario
+                INTO KING_ESTOQUE_MAT_MOV_EXCLUSAO (movimentacao, peca, usuario)
+                FROM 
+                    KING_ESTOQUE_MAT_MOV_PECA mp
+                JOIN 
+                    OPENJSON(%s) WITH (peca VARCHAR(6) '$') p ON p.peca = mp.peca
+                WHERE 
+                    mp.movimentacao = @movimentacao;
+            END
+
+            {SQL_RESULTADO_ALTERACAO}
+            """,
+            [movimentacao, data_modificacao, json.dumps(list(pecas))],
+        )
+        resultado = primeira(cursor, aparar=True)
+        if not resultado.alterada:
+            return self._motivo_falha(resultado, "alterada")
+
+        return (204, "Peças excluídas com sucesso.", None)
+
+    def sincronizar(self, cursor, usuario, operacoes):
+        """
+        Aplica, em ordem e na transação de quem chama, um lote de operações gravadas
+        offline pelo coletor. Cada operação roda em um savepoint próprio, então uma
+        falha não desfaz as demais. Operações já registradas (mesmo usuário e
+        id_cliente) não são reaplicadas: devolvem o resultado gravado.
+
+        Cada operação é um dict com id_cliente, tipo, dados (já validados) ou erros,
+        e movimentacao ou mov_cliente (id_cliente da operação que a criou).
+
+        Retorna (resultados, aplicadas): aplicadas traz, em ordem, (tipo,
+        movimentacao, dados, origem gravada) de cada operação aplicada neste lote,
+        para quem chama refletir os efeitos depois da confirmação.
+        """
+        ids = {op["id_cliente"] for op in operacoes}
+        ids.update(op["mov_cliente"] for op in operacoes if op.get("mov_cliente"))
+        registradas = self._operacoes_registradas(cursor, usuario, ids)
+
+        resultados = []
+        novas = []
+        aplicadas = []
+        for op in operacoes:
+            anterior = registradas.get(op["id_cliente"])
+            if anterior is not None:
+                resultados.append(
+                    self._resultado_sync(
+                        op,
+                        anterior.status_http,
+                        anterior.detalhe,
+                        anterior.movimentacao,
+                        repetida=True,
+                    )
+                )
+                continue
+
+            codigo, mensagem, movimentacao, origem = self._aplicar_sync(
+                cursor, op, registradas
+            )
+            resultados.append(self._resultado_sync(op, codigo, mensagem, movimentacao))
+
+            # Só o que foi aplicado fica registrado; uma falha pode ser reenviada
+            if codigo < 400:
+                registrada = {
+                    "usuario": usuario,
+                    "id_cliente": op["id_cliente"],
+                    "tipo": op["tipo"],
+                    "movimentacao": movimentacao,
+                    "status_http": codigo,
+                    "detalhe": mensagem,
+                }
+                novas.append(registrada)
+                registradas[op["id_cliente"]] = SimpleNamespace(**registrada)
+                aplicadas.append((op["tipo"], movimentacao, op["dados"], origem))
+
+        self._registrar_operacoes(cursor, novas)
+        return resultados, aplicadas
+
+    def _aplicar_sync(self, cursor, op, registradas):
+        if op.get("erros"):
+            return (400, json.dumps(op["erros"], ensure_ascii=False), None, None)
+
+        movimentacao = op.get("movimentacao")
+        if op.get("mov_cliente"):
+            criada = registradas.get(op["mov_cliente"])
+            if criada is None or criada.movimentacao is None:
+                return (
+                    404,
+                    f"Movimentação do cliente '{op['mov_cliente']}' não encontrada.",
+                    None,
+                    None,
+                )
+            movimentacao = criada.movimentacao
+
+        dados = op["dados"]
+        try:
+            with transaction.atomic():
+                if op["tipo"] == "criar_movimentacao":
+                    resultado = self.criar_movimentacao(cursor, dados)
+                elif op["tipo"] == "atualizar_movimentacao":
+                    resultado = self.atualizar_movimentacao(cursor, movimentacao, dados)
+                elif op["tipo"] == "excluir_movimentacao":
+                    resultado = self.excluir_movimentacao(cursor, movimentacao)
+                elif op["tipo"] == "incluir_pecas":
+                    resultado = self.incluir_pecas(
+                        cursor, movimentacao, dados["pecas"], dados["data_modificacao"]
+                    )
+                else:
+                    resultado = self.excluir_pecas(
+                        cursor, movimentacao, dados["pecas"], dados["data_modificacao"]
+                    )
+                codigo, mensagem, dados = resultado
+                origem = None
+                if op["tipo"] == "criar_movimentacao" and codigo < 400:
+                    movimentacao = dados
+                elif op["tipo"] == "atualizar_movimentacao" and codigo < 400:
+                    origem = dados
+                elif codigo >= 400 and dados:
+                    # Peças rejeitadas seguem no detalhe, como os erros de validação
+                    mensagem = json.dumps(
+                        {"detail": mensagem, "rejeitadas": dados}, ensure_ascii=False
+                    )
+                return (codigo, mensagem, movimentacao, origem)
+
+        except IntegrityError as e:
+            return (400, str(e), movimentacao, None)
+        except DatabaseError as e:
+            logging.error(f"Erro na sincronização da operação {op['id_cliente']}: {e}")
+            return (500, str(e), movimentacao, None)
+
+    def _resultado_sync(self, op, codigo, mensagem, movimentacao, repetida=False):
+        return {
+            "id_cliente": op["id_cliente"],
+            "tipo": op["tipo"],
+            "status": codigo,
+            "detail": mensagem,
+            "movimentacao": movimentacao,
+            "repetida": repetida,
+        }
+
+    def _operacoes_registradas(self, cursor, usuario, ids):
+        # UPDLOCK + HOLDLOCK trava as chaves lidas (ou ainda ausentes) até o fim da
+        # transação: dois envios simultâneos do mesmo lote são aplicados um após o outro
+        cursor.execute(
+            """
+            SELECT s.id_cliente, s.movimentacao, s.status_http, s.detalhe
+            FROM 
+                OPENJSON(%s) WITH (id_cliente VARCHAR(64) '$') ids
+            JOIN 
+                KING_ESTOQUE_MAT_MOV_SYNC s WITH (UPDLOCK, HOLDLOCK)
+                    ON s.usuario = %s AND s.id_cliente = ids.id_cliente
+            """,
+            [json.dumps(sorted(ids)), usuario],
+        )
+        return {op.id_cliente: op for op in linhas(cursor, aparar=True)}
+
+    def _registrar_operacoes(self, cursor, operacoes):
+        colunas = (
+            "usuario",
+            "id_cliente",
+            "tipo",
+            "movimentacao",
+            "status_http",
+            "detalhe",
+        )
+        linha = "(" + ", ".join(["%s"] * len(colunas)) + ")"
+        tamanho = (LIMITE_PARAMETROS - 1) // len(colunas)
+
+        for inicio in range(0, len(operacoes), tamanho):
+            lote = operacoes[inicio : inicio + tamanho]
+            cursor.execute(
+                f"""
+                INSERT INTO KING_ESTOQUE_MAT_MOV_SYNC ({', '.join(colunas)})
+                VALUES {', '.join([linha] * len(lote))}
+                """,
+                [op[coluna] for op in lote for coluna in colunas],
+            )
+
+    # Fila de finalização assíncrona (KING_ESTOQUE_MAT_MOV_FINALIZACAO)
+
+    def reservar_finalizacao(self, cursor):
+        """
+        Reserva a próxima finalização pronta para processamento e retorna a linha
+        reservada (movimentacao, tentativas) ou None. READPAST deixa vários
+        processadores trabalharem em paralelo sem disputar a mesma linha.
+        """
+        cursor.execute(
+            """
+            WITH proxima AS (
+                SELECT TOP (1) *
+                FROM KING_ESTOQUE_MAT_MOV_FINALIZACAO WITH (UPDLOCK, READPAST, ROWLOCK)
+                WHERE status IN ('Pendente', 'Processando', 'Erro')
+                  AND proxima_tentativa <= GETDATE()
+                ORDER BY proxima_tentativa
+            )
+            UPDATE proxima
+            SET status = 'Processando',
+                tentativas = tentativas + 1,
+                proxima_tentativa = DATEADD(SECOND, %s, GETDATE())
+            OUTPUT INSERTED.movimentacao, INSERTED.tentativas
+            """,
+            [getattr(settings, "ESTOQUE_FINALIZACAO_PRAZO", 600)],
+        )
+        return primeira(cursor)
+
+    def realocar_lote_finalizacao(self, cursor, movimentacao, tamanho):
+        """
+        Um lote da realocação de uma finalização agendada. O progresso é gravado na
+        mesma transação do lote, e a reserva da linha é renovada a cada lote.
+        """
+        realocadas = self.realocar_lote(cursor, movimentacao, tamanho)
+        cursor.execute(
+            """
+            UPDATE KING_ESTOQUE_MAT_MOV_FINALIZACAO
+            SET pecas_realocadas = pecas_realocadas + %s,
+                proxima_tentativa = DATEADD(SECOND, %s, GETDATE())
+            WHERE movimentacao = %s
+            """,
+            [
+                realocadas,
+                getattr(settings, "ESTOQUE_FINALIZACAO_PRAZO", 600),
+                movimentacao,
+            ],
+        )
+        return realocadas
+
+    def concluir_finalizacao(self, cursor, movimentacao):
+        """Marca a movimentação como Finalizada depois da realocação das peças."""
+        cursor.execute(
+            """
+            UPDATE KING_ESTOQUE_MAT_MOV
+            SET status = 'Finalizada', data_modificacao = GETDATE()
+            WHERE movimentacao = %s AND status = 'Finalizando'
+            """,
+            [movimentacao],
+        )
+        cursor.execute(
+            """
+            UPDATE KING_ESTOQUE_MAT_MOV_FINALIZACAO
+            SET status = 'Concluida', erro = NULL, data_conclusao = GETDATE()
+            WHERE movimentacao = %s
+            """,
+            [movimentacao],
+        )
+
+    def registrar_falha_finalizacao(self, cursor, movimentacao, tentativas, erro):
+        """
+        Devolve a finalização à fila com espera exponencial entre as tentativas;
+        esgotadas as tentativas, ela fica como 'Falhou' até ser reprocessada.
+        """
+        maximo = getattr(settings, "ESTOQUE_FINALIZACAO_TENTATIVAS", 5)
+        espera = getattr(settings, "ESTOQUE_FINALIZACAO_ESPERA", 30) * 2 ** (
+            tentativas - 1
+        )
+        cursor.execute(
+            """
+            UPDATE KING_ESTOQUE_MAT_MOV_FINALIZACAO
+            SET status = %s, erro = %s, proxima_tentativa = DATEADD(SECOND, %s, GETDATE())
+            WHERE movimentacao = %s
+            """,
+            [
+                "Falhou" if tentativas >= maximo else "Erro",
+                str(erro)[:1000],
+                min(espera, 86400),
+                movimentacao,
+            ],
+        )
+
+    def obter_finalizacao(self, cursor, movimentacao):
+        cursor.execute(
+            """
+            SELECT 
+                f.movimentacao,
+                f.status,
+                f.tentativas,
+                f.pecas_realocadas,
+                m.total_pecas,
+                f.proxima_tentativa,
+                f.erro,
+                f.data_solicitacao,
+                f.data_conclusao,
+                m.status AS status_movimentacao
+            FROM 
+                KING_ESTOQUE_MAT_MOV_FINALIZACAO f
+            LEFT JOIN 
+                KING_ESTOQUE_MAT_MOV m ON m.movimentacao = f.movimentacao
+            WHERE 
+                f.movimentacao = %s
+            """,
+            [movimentacao],
+        )
+        return primeira(cursor, aparar=True)
+
+    def reprocessar_finalizacao(self, cursor, movimentacao):
+        """Devolve à fila, com as tentativas zeradas, uma finalização que falhou."""
+        cursor.execute(
+            """
+            UPDATE KING_ESTOQUE_MAT_MOV_FINALIZACAO
+            SET status = 'Pendente', tentativas = 0, proxima_tentativa = GETDATE()
+            OUTPUT INSERTED.movimentacao
+            WHERE movimentacao = %s AND status = 'Falhou'
+            """,
+            [movimentacao],
+        )
+        if primeira(cursor) is not None:
+            return (202, "Finalização da movimentação agendada.", None)
+
+        finalizacao = self.obter_finalizacao(cursor, movimentacao)
+        if finalizacao is None:
+            return (404, "Finalização não encontrada.", None)
+        return (
+            400,
+            f"A finalização está com status '{finalizacao.status}' e não pode ser reprocessada.",
+            None,
+        )
+
+    # Resumos agregados no banco
+
+    def resumir_movimentacao(self, cursor, movimentacao, usuario=None):
+        """
+        Cabeçalho da movimentação e os totais das suas peças por material, cor e
+        unidade, ou None se a movimentação não existe (ou, com usuario, não é dele).
+        """
+        cabecalhos = self.carregar_cabecalhos(
+            cursor,
+            f"""
+            SELECT {SQL_CABECALHO_MOVIMENTACAO}
+            FROM {SQL_MOVIMENTACOES_COM_ARQUIVO} m
+            WHERE m.movimentacao = %s AND (%s IS NULL OR m.usuario = %s)
+            """,
+            [movimentacao, usuario, usuario],
+        )
+        if not cabecalhos:
+            return None
+
+        cursor.execute(
+            f"""
+            SELECT 
+                mp.material,
+                mp.cor_material,
+                mp.unidade,
+                COUNT(*) AS pecas,
+                SUM(mp.quantidade) AS quantidade
+            FROM 
+                {SQL_PECAS_COM_ARQUIVO} mp
+            WHERE 
+                mp.movimentacao = %s
+            GROUP BY 
+                mp.material, mp.cor_material, mp.unidade
+            ORDER BY 
+                mp.material, mp.cor_material, mp.unidade
+            """,
+            [movimentacao],
+        )
+        itens = todas(cursor, CAMPOS_DESCRICAO, aparar=True)
+        for item in itens:
+            catalogo.descrever(item)
+
+        return cabecalhos[0], itens
+
+    def resumo_diario(self, cursor, inicio, fim, usuario=None):
+        """Totais de movimentações e peças por usuário e dia de início, em [inicio, fim)."""
+        condicoes = ["m.data_inicio >= %s", "m.data_inicio < %s"]
+        params = [inicio, fim]
+        if usuario:
+            condicoes.append("m.usuario = %s")
+            params.append(usuario)
+
+        cursor.execute(
+            f"""
+            SELECT 
+                m.usuario,
+                CAST(m.data_inicio AS DATE) AS dia,
+                COUNT(DISTINCT m.movimentacao) AS movimentacoes,
+                COUNT(DISTINCT CASE WHEN m.status = 'Finalizada' THEN m.movimentacao END)
+                    AS finalizadas,
+                COUNT(mp.peca) AS pecas,
+                ISNULL(SUM(mp.quantidade), 0) AS quantidade
+            FROM 
+                {SQL_MOVIMENTACOES_COM_ARQUIVO} m
+            LEFT JOIN 
+                {SQL_PECAS_COM_ARQUIVO} mp ON mp.movimentacao = m.movimentacao
+            WHERE 
+                {' AND '.join(condicoes)}
+            GROUP BY 
+                m.usuario, CAST(m.data_inicio AS DATE)
+            ORDER BY 
+                dia, m.usuario
+            """,
+            params,
+        )
+        return todas(cursor, aparar=True)
+
+    # Conferência (inventário) de localizações
+
+    def conferir_localizacao(self, cursor, localizacao, pecas):
+        """
+        Compara as peças lidas em uma contagem com o estoque da localização, em uma
+        única consulta: faltantes (no estoque da localização e não lidas), excedentes
+        (lidas, mas registradas em outra localização) e desconhecidas (lidas e sem
+        estoque). As leituras vão para uma variável de tabela com chave, para que o
+        otimizador conheça a quantidade e escolha a junção adequada a contagens grandes.
+        """
+        cursor.execute(
+            """
+            SET NOCOUNT ON;
+
+            DECLARE @lidas TABLE (peca VARCHAR(6) PRIMARY KEY);
+
+            INSERT INTO @lidas (peca)
+            SELECT DISTINCT j.peca
+            FROM OPENJSON(%s) WITH (peca VARCHAR(6) '$') j
+            WHERE j.peca IS NOT NULL AND j.peca <> '';
+
+            SELECT 
+                CASE
+                    WHEN l.peca IS NULL THEN 'faltante'
+                    WHEN e.peca IS NOT NULL THEN 'conferida'
+                    WHEN o.peca IS NOT NULL THEN 'excedente'
+                    ELSE 'desconhecida'
+                END AS situacao,
+                COALESCE(e.peca, o.peca, l.peca) AS peca,
+                COALESCE(e.partida, o.partida) AS partida,
+                COALESCE(e.filial, o.filial) AS filial,
+                COALESCE(e.localizacao, o.localizacao) AS localizacao,
+                COALESCE(e.material, o.material) AS material,
+                COALESCE(e.cor_material, o.cor_material) AS cor_material,
+                COALESCE(e.qtde, o.qtde) AS quantidade
+            FROM (
+                SELECT ep.peca, ep.partida, ep.filial, ep.localizacao,
+                       ep.material, ep.cor_material, ep.qtde
+                FROM ESTOQUE_MAT_PECA ep
+                WHERE ep.localizacao = %s
+                  AND ep.PECA IS NOT NULL
+                  AND ep.PECA <> ''
+                  AND ep.qtde > 0
+            ) e
+            FULL OUTER JOIN @lidas l ON l.peca = e.peca
+            OUTER APPLY (
+                SELECT TOP (1) ep.peca, ep.partida, ep.filial, ep.localizacao,
+                       ep.material, ep.cor_material, ep.qtde
+                FROM ESTOQUE_MAT_PECA ep
+                WHERE e.peca IS NULL AND ep.peca = l.peca AND ep.qtde > 0
+                ORDER BY ep.localizacao
+            ) o
+            OPTION (RECOMPILE);
+            """,
+            [json.dumps(pecas), localizacao],
+        )
+
+        conferencia = {
+            "conferida": {},
+            "faltante": {},
+            "excedente": {},
+            "desconhecida": {},
+        }
+        for peca in linhas(cursor, extras=CAMPOS_DESCRICAO, aparar=True):
+            situacao = conferencia[peca.situacao]
+            if peca.peca not in situacao:
+                if peca.material is not None:
+                    catalogo.descrever(peca)
+                situacao[peca.peca] = peca
+
+        return {
+            "localizacao": localizacao,
+            "lidas": len(conferencia["conferida"])
+            + len(conferencia["excedente"])
+            + len(conferencia["desconhecida"]),
+            "esperadas": len(conferencia["conferida"]) + len(conferencia["faltante"]),
+            "conferidas": len(conferencia["conferida"]),
+            "faltantes": list(conferencia["faltante"].values()),
+            "excedentes": list(conferencia["excedente"].values()),
+            "desconhecidas": list(conferencia["desconhecida"]),
+        }
+
+    # Saldo por localização (KING_ESTOQUE_MAT_SALDO)
+
+    def reconstruir_saldo(self, cursor):
+        """
+        Recalcula todo o saldo a partir de ESTOQUE_MAT_PECA, corrigindo diferenças de
+        alterações feitas fora do ScanMove. O TABLOCKX segura as finalizações até o
+        fim da transação, para nenhuma diferença ser aplicada no meio da recarga.
+        """
+        cursor.execute(
+            """
+            SET NOCOUNT ON;
+
+            DELETE FROM KING_ESTOQUE_MAT_SALDO WITH (TABLOCKX);
+
+            INSERT INTO KING_ESTOQUE_MAT_SALDO (
+                localizacao, material, cor_material, pecas, quantidade, data_atualizacao
+            )
+            SELECT 
+                e.localizacao,
+                e.material,
+                e.cor_material,
+                COUNT(*),
+                SUM(e.qtde),
+                GETDATE()
+            FROM 
+                ESTOQUE_MAT_PECA e
+            WHERE 
+                e.localizacao IS NOT NULL
+            AND e.PECA IS NOT NULL 
+            AND e.PECA <> '' 
+            AND e.qtde > 0
+            GROUP BY 
+                e.localizacao, e.material, e.cor_material;
+
+            SELECT @@ROWCOUNT AS linhas;
+            """
+        )
+        return primeira(cursor).linhas
+
+    def consultar_saldo(self, cursor, localizacao=None, filial=None, material=None):
+        condicoes = []
+        params = []
+        if localizacao:
+            condicoes.append("s.localizacao = %s")
+            params.append(localizacao)
+        if filial:
+            condicoes.append(
+                "s.localizacao IN (SELECT localizacao FROM MATERIAIS_LOCALIZA WHERE filial = %s)"
+            )
+            params.append(filial)
+        if material:
+            condicoes.append("s.material = %s")
+            params.append(material)
+
+        cursor.execute(
+            f"""
+            SELECT 
+                s.localizacao,
+                s.material,
+                s.cor_material,
+                s.pecas,
+                s.quantidade,
+                s.data_atualizacao
+            FROM 
+                KING_ESTOQUE_MAT_SALDO s
+            WHERE 
+                {' AND '.join(condicoes)}
+            ORDER BY 
+                s.localizacao, s.material, s.cor_material
+            """,
+            params,
+        )
+        saldo = todas(cursor, CAMPOS_DESCRICAO + ("filial",), aparar=True)
+        for item in saldo:
+            item.filial = localizacoes.filial(item.localizacao)
+            catalogo.descrever(item)
+        return saldo
+
+    # Arquivamento das movimentações finalizadas
+
+    def tamanho_lote_arquivamento(self):
+        return max(1, getattr(settings, "ESTOQUE_LOTE_ARQUIVAMENTO", 200))
+
+    def arquivar_lote(self, cursor, finalizadas_ate, tamanho):
+        """
+        Move até tamanho movimentações finalizadas antes de finalizadas_ate, com as
+        suas peças, para KING_ESTOQUE_MAT_MOV_ARQ e KING_ESTOQUE_MAT_MOV_PECA_ARQ, e
+        retorna quantas moveu. As peças saem da tabela ativa já gravadas no arquivo
+        (DELETE com OUTPUT INTO); READPAST pula movimentações bloqueadas por outra
+        transação, que ficam para o próximo lote.
+        """
+        cursor.execute(
+            f"""
+            SET NOCOUNT ON;
+
+            DECLARE @lote TABLE (movimentacao INT PRIMARY KEY);
+
+            INSERT INTO @lote (movimentacao)
+            SELECT TOP (%s) m.movimentacao
+            FROM KING_ESTOQUE_MAT_MOV m WITH (UPDLOCK, READPAST, ROWLOCK)
+            WHERE m.status = 'Finalizada' AND m.data_modificacao < %s
+            ORDER BY m.movimentacao;
+
+            INSERT INTO KING_ESTOQUE_MAT_MOV_ARQ (
+                movimentacao, data_inicio, data_modificacao, status,
+                usuario, origem, destino, total_pecas
+            )
+            SELECT {SQL_CABECALHO_MOVIMENTACAO}
+            FROM KING_ESTOQUE_MAT_MOV m
+            JOIN @lote l ON l.movimentacao = m.movimentacao;
+
+            DELETE mp
+            OUTPUT {', '.join(f"DELETED.{coluna}" for coluna in COLUNAS_MOV_PECA)}
+            INTO KING_ESTOQUE_MAT_MOV_PECA_ARQ ({', '.join(COLUNAS_MOV_PECA)})
+            FROM KING_ESTOQUE_MAT_MOV_PECA mp
+            JOIN @lote l ON l.movimentacao = mp.movimentacao;
+
+            DELETE f
+            FROM KING_ESTOQUE_MAT_MOV_FINALIZACAO f
+            JOIN @lote l ON l.movimentacao = f.movimentacao;
+
+            DELETE m
+            FROM KING_ESTOQUE_MAT_MOV m
+            JOIN @lote l ON l.movimentacao = m.movimentacao;
+
+            SELECT COUNT(*) AS arquivadas FROM @lote;
+            """,
+            [tamanho, finalizadas_ate],
+        )
+        return primeira(cursor).arquivadas
+
+    def expurgar_exclusoes(self, cursor, excluidas_ate, tamanho):
+        """
+        Apaga até tamanho registros de exclusão (KING_ESTOQUE_MAT_MOV_EXCLUSAO)
+        anteriores a excluidas_ate e retorna quantos apagou. O feed de alterações
+        recusa marcas mais antigas que ESTOQUE_ALTERACOES_DIAS, então nenhum token
+        aceito depende dos registros anteriores a esse prazo.
+        """
+        cursor.execute(
+            """
+            SET NOCOUNT ON;
+
+            DELETE TOP (%s) FROM KING_ESTOQUE_MAT_MOV_EXCLUSAO
+            WHERE data_exclusao < %s;
+
+            SELECT @@ROWCOUNT AS expurgadas;
+            """,
+            [tamanho, excluidas_ate],
+        )
+        return primeira(cursor).expurgadas
@@ -1,3 +1,549 @@
-from django.test import TestCase
+from datetime import datetime, timedelta
+from decimal import Decimal
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from kingjoe.db import linhas, primeira, tipo_linha, todas
+from .catalogo import CAMPOS_DESCRICAO, CatalogoMateriais
+from .localizacoes import IndiceLocalizacoes
+from .pecas_origem import PecasOrigem
+from .serializers import (
+    AlteracoesSerializer,
+    FiltroHistoricoSerializer,
+    FiltroPecasLocalizacaoSerializer,
+    LocalizacoesSerializer,
+    MovimentacaoSerializer,
+    OperacaoSyncSerializer,
+    PecaSerializer,
+    SincronizacaoSerializer,
+    representar_localizacao,
+    representar_movimentacao,
+    representar_peca,
+)
+from .services import CAMPOS_CABECALHO, MovimentacaoService
+from .views import MovimentacaoViewSet, etag_confere, gerar_etag, separar_exclusoes
+
+
+class CursorFalso:
+    """Cursor mínimo com description no formato do pyodbc (nome, tipo, ...)."""
+
+    def __init__(self, colunas, rows):
+        self.description = [(nome, tipo) for nome, tipo in colunas]
+        self._rows = list(rows)
+        self.blocos = []
+
+    def fetchmany(self, tamanho):
+        self.blocos.append(tamanho)
+        bloco, self._rows = self._rows[:tamanho], self._rows[tamanho:]
+        return bloco
+
+    def fetchone(self):
+        bloco = self.fetchmany(1)
+        return bloco[0] if bloco else None
+
+
+class LinhaTests(SimpleTestCase):
+    def test_atributos_e_chaves(self):
+        cursor = CursorFalso(
+            [("PECA", str), ("Qtde", Decimal)], [("  000001 ", Decimal("1.5"))]
+        )
+        linha = todas(cursor, extras=("desc_material",))[0]
+
+        self.assertEqual(linha.peca, "  000001 ")
+        self.assertEqual(linha["qtde"], Decimal("1.5"))
+        self.assertEqual(linha.get("inexistente", 0), 0)
+        self.assertIn("desc_material", linha)
+        self.assertIsNone(linha.desc_material)
+        linha["desc_material"] = "TECIDO"
+        self.assertEqual(
+            linha.as_dict(),
+            {"peca": "  000001 ", "qtde": Decimal("1.5"), "desc_material": "TECIDO"},
+        )
+
+    def test_aparar_so_textos(self):
+        cursor = CursorFalso(
+            [("peca", str), ("partida", str), ("qtde", Decimal)],
+            [(" 000001 ", None, Decimal("2"))],
+        )
+        linha = todas(cursor, aparar=True)[0]
+        self.assertEqual((linha.peca, linha.partida, linha.qtde), ("000001", None, 2))
+
+    def test_colunas_repetidas_ou_invalidas(self):
+        cursor = CursorFalso(
+            [("peca", str), ("PECA", str), ("from", str), ("", int), ("total", int)],
+            [("a", "b", "c", 1, 2)],
+        )
+        linha = todas(cursor, extras=("total", "extra"))[0]
+
+        self.assertEqual(
+            linha.keys(),
+            ("peca", "coluna_1", "coluna_2", "coluna_3", "total", "extra"),
+        )
+        self.assertEqual((linha.peca, linha.coluna_1, linha.coluna_2), ("a", "b", "c"))
+        self.assertEqual(linha.total, 2)
+
+    def test_tipo_reaproveitado_por_formato(self):
+        colunas = [("peca", str), ("qtde", Decimal)]
+        self.assertIs(
+            tipo_linha(CursorFalso(colunas, [])), tipo_linha(CursorFalso(colunas, []))
+        )
+        self.assertIsNot(
+            tipo_linha(CursorFalso(colunas, [])),
+            tipo_linha(CursorFalso(colunas, []), aparar=True),
+        )
+
+    def test_linhas_le_em_blocos(self):
+        cursor = CursorFalso([("peca", str)], [(str(i),) for i in range(5)])
+        gerador = linhas(cursor, tamanho_bloco=2)
+
+        self.assertEqual(next(gerador).peca, "0")
+        self.assertEqual(cursor.blocos, [2])
+        self.assertEqual([linha.peca for linha in gerador], ["1", "2", "3", "4"])
+        self.assertEqual(cursor.blocos, [2, 2, 2, 2])
+
+    def test_primeira(self):
+        self.assertIsNone(primeira(CursorFalso([("peca", str)], [])))
+        linha = primeira(CursorFalso([("peca", str)], [("1",), ("2",)]))
+        self.assertEqual(linha.peca, "1")
+
+
+COLUNAS_PECA = [
+    ("peca", str),
+    ("partida", str),
+    ("material", str),
+    ("cor_material", str),
+    ("unidade", str),
+    ("quantidade", Decimal),
+    ("localizacao", str),
+    ("filial", str),
+]
+
+COLUNAS_CABECALHO = [
+    ("movimentacao", int),
+    ("data_inicio", datetime),
+    ("data_modificacao", datetime),
+    ("status", str),
+    ("usuario", str),
+    ("origem", str),
+    ("destino", str),
+    ("total_pecas", int),
+]
+
+PECAS = [
+    (
+        "123456",
+        "P01   ",
+        "10.01.0001 ",
+        "001  ",
+        "MT   ",
+        Decimal("12.5"),
+        "A01-01  ",
+        "MATRIZ   ",
+    ),
+    (" 65432", None, "10.01.0002", "002", "KG", Decimal("0.125"), None, None),
+]
+
+CABECALHO = (
+    42,
+    datetime(2024, 5, 6, 8, 30, 15),
+    datetime(2024, 5, 6, 9, 0, 0, 123000),
+    "Andamento ",
+    "joao     ",
+    "A01-01  ",
+    "B02-03  ",
+    2,
+)
+
+
+def descrever(peca):
+    peca["desc_material"] = "TECIDO PLANO  "
+    peca["desc_cor_material"] = "AZUL "
+    return peca
+
+
+class RepresentacaoRapidaTests(SimpleTestCase):
+    """A representação rápida deve produzir exatamente a saída dos serializers."""
+
+    def pecas_drf(self):
+        colunas = [nome for nome, _ in COLUNAS_PECA]
+        return [descrever(dict(zip(colunas, row))) for row in PECAS]
+
+    def pecas_rapidas(self):
+        pecas = todas(CursorFalso(COLUNAS_PECA, PECAS), CAMPOS_DESCRICAO, aparar=True)
+        for peca in pecas:
+            # O catálogo em memória já guarda as descrições aparadas
+            peca.desc_material = "TECIDO PLANO"
+            peca.desc_cor_material = "AZUL"
+        return pecas
+
+    def test_peca(self):
+        for drf, rapida in zip(self.pecas_drf(), self.pecas_rapidas()):
+            self.assertEqual(representar_peca(rapida), PecaSerializer(drf).data)
+
+    def test_movimentacao(self):
+        colunas = [nome for nome, _ in COLUNAS_CABECALHO]
+        drf = dict(zip(colunas, CABECALHO))
+        drf.update(
+            filial_origem="MATRIZ",
+            filial_destino=None,
+            pecas=self.pecas_drf(),
+        )
+
+        rapida = todas(
+            CursorFalso(COLUNAS_CABECALHO, [CABECALHO]), CAMPOS_CABECALHO, aparar=True
+        )[0]
+        rapida.filial_origem = "MATRIZ"
+        rapida.filial_destino = None
+        rapida.pecas = self.pecas_rapidas()
+
+        self.assertEqual(
+            representar_movimentacao(rapida), MovimentacaoSerializer(drf).data
+        )
+        self.assertEqual(
+            representar_movimentacao.lista([rapida]),
+            MovimentacaoSerializer([drf], many=True).data,
+        )
+
+    def test_movimentacao_sem_pecas(self):
+        colunas = [nome for nome, _ in COLUNAS_CABECALHO]
+        drf = dict(
+            zip(colunas, CABECALHO), filial_origem=None, filial_destino=None, pecas=[]
+        )
+        rapida = todas(
+            CursorFalso(COLUNAS_CABECALHO, [CABECALHO]), CAMPOS_CABECALHO, aparar=True
+        )[0]
+        rapida.pecas = []
+
+        self.assertEqual(
+            representar_movimentacao(rapida), MovimentacaoSerializer(drf).data
+        )
+
+    def test_localizacao(self):
+        instancia = {"localizacao": "A01-01", "filial": "MATRIZ"}
+        self.assertEqual(
+            representar_localizacao(instancia),
+            LocalizacoesSerializer(
+                {"localizacao": "A01-01  ", "filial": " MATRIZ"}
+            ).data,
+        )
+
+
+class EtagTests(SimpleTestCase):
+    def test_etag_muda_com_a_versao(self):
+        etag = gerar_etag(42, 1001)
+        self.assertEqual(etag, gerar_etag(42, 1001))
+        self.assertNotEqual(etag, gerar_etag(42, 1002))
+        self.assertNotEqual(etag, gerar_etag(42, None))
+
+    def test_if_none_match(self):
+        etag = gerar_etag(42)
+        fabrica = RequestFactory()
+        for cabecalho, esperado in [
+            (etag, True),
+            (f"W/{etag}", True),
+            (f'"outra", {etag}', True),
+            ("*", True),
+            ('"outra"', False),
+        ]:
+            request = fabrica.get("/", HTTP_IF_NONE_MATCH=cabecalho)
+            self.assertIs(etag_confere(request, etag), esperado, cabecalho)
+        self.assertFalse(etag_confere(fabrica.get("/"), etag))
+
+
+class PermissoesSupervisorTests(SimpleTestCase):
+    def resposta(self, acao, **kwargs):
+        request = APIRequestFactory().get("/")
+        usuario = mock.Mock(is_authenticated=True, is_staff=False)
+        usuario.get_username.return_value = "joao"
+        force_authenticate(request, user=usuario)
+        return MovimentacaoViewSet.as_view({"get": acao})(request, **kwargs)
+
+    def test_consultas_de_todos_os_usuarios(self):
+        for acao in MovimentacaoViewSet.acoes_supervisor:
+            self.assertEqual(self.resposta(acao).status_code, 403, acao)
+
+    @mock.patch("app_estoque_mp.views.connections", mock.MagicMock())
+    def test_resumo_so_do_dono(self):
+        with mock.patch.object(
+            MovimentacaoService, "resumir_movimentacao", return_value=None
+        ) as resumir:
+            resposta = self.resposta("resumo_movimentacao", movimentacao=42)
+
+        self.assertEqual(resposta.status_code, 404)
+        self.assertEqual(resumir.call_args.args[1:], (42, "joao"))
+
+
+class AlteracoesSerializerTests(SimpleTestCase):
+    def desde(self, valor):
+        filtro = AlteracoesSerializer(data={"desde": valor})
+        self.assertTrue(filtro.is_valid(), filtro.errors)
+        return filtro.validated_data["desde"]
+
+    def test_token(self):
+        token = AlteracoesSerializer.gerar_token(123456789)
+        self.assertEqual(self.desde(token), (None, 123456789))
+
+    def test_timestamp(self):
+        data = datetime.now().replace(microsecond=0) - timedelta(days=1)
+        self.assertEqual(self.desde(data.isoformat()), (data, None))
+
+    @override_settings(ESTOQUE_ALTERACOES_DIAS=30)
+    def test_marca_anterior_ao_prazo(self):
+        with mock.patch("time.time", return_value=time.time() - 31 * 86400):
+            token = AlteracoesSerializer.gerar_token(1)
+        antiga = (datetime.now() - timedelta(days=31)).isoformat()
+        for valor in [token, antiga]:
+            filtro = AlteracoesSerializer(data={"desde": valor})
+            self.assertFalse(filtro.is_valid())
+            self.assertIn("prazo", str(filtro.errors["desde"]))
+
+    def test_invalido(self):
+        token = AlteracoesSerializer.gerar_token(1)
+        for valor in ["ontem", token[:-1] + "x"]:
+            self.assertFalse(AlteracoesSerializer(data={"desde": valor}).is_valid())
+
+
+class CursorTests(SimpleTestCase):
+    def cursor(self, filtro_class, valor):
+        filtro = filtro_class(data={"cursor": valor})
+        self.assertTrue(filtro.is_valid(), filtro.errors)
+        return filtro.validated_data["cursor"]
+
+    def test_historico(self):
+        data_inicio = datetime(2024, 5, 6, 8, 30, 15)
+        cursor = FiltroHistoricoSerializer.gerar_cursor(
+            {"data_inicio": data_inicio, "movimentacao": 42}
+        )
+        self.assertEqual(
+            self.cursor(FiltroHistoricoSerializer, cursor), (data_inicio, 42)
+        )
+
+    def test_pecas_localizacao(self):
+        cursor = FiltroPecasLocalizacaoSerializer.gerar_cursor("123456")
+        self.assertEqual(
+            self.cursor(FiltroPecasLocalizacaoSerializer, cursor), "123456"
+        )
+
+    def test_cursor_de_outro_filtro(self):
+        cursor = FiltroPecasLocalizacaoSerializer.gerar_cursor("123456")
+        for filtro_class, valor in [
+            (FiltroHistoricoSerializer, cursor),
+            (FiltroPecasLocalizacaoSerializer, cursor[:-1] + "x"),
+        ]:
+            self.assertFalse(filtro_class(data={"cursor": valor}).is_valid())
+
+
+class SepararExclusoesTests(SimpleTestCase):
+    def test_peca_incluida_de_novo_nao_e_excluida(self):
+        cursor = CursorFalso(
+            [("movimentacao", int), ("peca", str)],
+            [(1, None), (1, "000001"), (2, "000001"), (2, "000002")],
+        )
+        exclusoes = todas(cursor)
+        movimentacao = todas(
+            CursorFalso([("movimentacao", int)], [(2,)]), extras=("pecas",)
+        )[0]
+        movimentacao.pecas = todas(CursorFalso([("peca", str)], [("000001",)]))
+
+        excluidas, pecas_excluidas = separar_exclusoes([movimentacao], exclusoes)
+
+        self.assertEqual(excluidas, [1])
+        self.assertEqual(pecas_excluidas, [{"movimentacao": 2, "peca": "000002"}])
+
+
+class SincronizacaoSerializerTests(SimpleTestCase):
+    def test_id_cliente_repetido(self):
+        operacao = {
+            "id_cliente": "a1",
+            "tipo": "excluir_movimentacao",
+            "movimentacao": 1,
+        }
+        lote = SincronizacaoSerializer(data={"operacoes": [operacao, operacao]})
+        self.assertFalse(lote.is_valid())
+
+    def test_operacao_sem_movimentacao(self):
+        operacao = OperacaoSyncSerializer(
+            data={"id_cliente": "a1", "tipo": "incluir_pecas"}
+        )
+        self.assertFalse(operacao.is_valid())
+
+    def test_dados_invalidos_viram_erros_da_operacao(self):
+        operacao = OperacaoSyncSerializer(
+            data={
+                "id_cliente": "a1",
+                "tipo": "excluir_pecas",
+                "mov_cliente": "a0",
+                "dados": {"pecas": ["123456"]},
+            }
+        )
+        self.assertTrue(operacao.is_valid(), operacao.errors)
+        preparada = OperacaoSyncSerializer.preparar(operacao.validated_data)
+        self.assertIn("data_modificacao", preparada["erros"])
+
+
+COLUNAS_VALIDACAO = [
+    ("peca", str),
+    ("estoque", str),
+    ("localizacao", str),
+    ("material", str),
+    ("cor_material", str),
+    ("partida", str),
+    ("quantidade", Decimal),
+    ("origem", str),
+    ("em_movimentacao", int),
+]
+
+
+class ValidacaoPecasTests(SimpleTestCase):
+    def estoque(self, **valores):
+        linha = dict(
+            peca="123456",
+            estoque="123456",
+            localizacao="A01-01  ",
+            material="10.01.0001",
+            cor_material="001",
+            partida="P01",
+            quantidade=Decimal("12.500"),
+            origem="A01-01",
+            em_movimentacao=None,
+        )
+        linha.update(valores)
+        cursor = CursorFalso(COLUNAS_VALIDACAO, [tuple(linha.values())])
+        return todas(cursor, aparar=True)[0]
+
+    def motivos(self, estoque, movimentacao=None, repetida=False, **valores):
+        peca = dict(
+            peca="123456",
+            material="10.01.0001",
+            cor_material="001",
+            partida="P01",
+            quantidade=Decimal("12.5"),
+        )
+        peca.update(valores)
+        motivos = MovimentacaoService()._motivos_rejeicao(
+            peca, estoque, movimentacao, repetida
+        )
+        return [codigo for codigo, _ in motivos]
+
+    def test_peca_valida(self):
+        self.assertEqual(self.motivos(self.estoque()), [])
+
+    def test_nao_encontrada(self):
+        self.assertEqual(self.motivos(self.estoque(estoque=None)), ["nao_encontrada"])
+
+    def test_origem_dados_e_movimentacao_aberta(self):
+        estoque = self.estoque(localizacao="B02-03", em_movimentacao=7)
+        self.assertEqual(
+            self.motivos(estoque, repetida=True, cor_material="002"),
+            ["duplicada", "fora_da_origem", "divergente", "em_outra_movimentacao"],
+        )
+        self.assertIn("ja_incluida", self.motivos(estoque, movimentacao=7))
+
+    def test_origem_sem_distincao_de_maiusculas(self):
+        estoque = self.estoque(localizacao="A01-01  ", origem=" a01-01")
+        self.assertEqual(self.motivos(estoque), [])
+
+    def test_sem_origem_nao_confere_localizacao(self):
+        estoque = self.estoque(localizacao="B02-03", origem=None)
+        self.assertEqual(self.motivos(estoque), [])
+
+
+class PecasOrigemTests(SimpleTestCase):
+    def pecas(self, *codigos):
+        cursor = CursorFalso([("peca", str)], [(codigo,) for codigo in codigos])
+        return todas(cursor)
+
+    def test_guarda_por_usuario(self):
+        cache = PecasOrigem(ttl=60, max_usuarios=10, max_pecas=10)
+        cache.guardar("ana", 1, "A01-01", self.pecas("000001", "000002"))
+
+        self.assertEqual(cache.obter("ana", "000002").peca, "000002")
+        self.assertIsNone(cache.obter("ana", "000003"))
+        self.assertIsNone(cache.obter("bruno", "000001"))
+
+    def test_limites(self):
+        cache = PecasOrigem(ttl=60, max_usuarios=1, max_pecas=1)
+        cache.guardar("ana", 1, "A01-01", self.pecas("000001"))
+        cache.guardar("bruno", 2, "A01-02", self.pecas("000002"))
+        self.assertIsNone(cache.obter("ana", "000001"))
+
+        cache.guardar("bruno", 2, "A01-02", self.pecas("000002", "000003"))
+        self.assertIsNone(cache.obter("bruno", "000002"))
+
+    def test_descarta_so_a_movimentacao(self):
+        cache = PecasOrigem(ttl=60, max_usuarios=10, max_pecas=10)
+        cache.guardar("ana", 1, "A01-01", self.pecas("000001"))
+        cache.guardar("bruno", 2, "A01-01", self.pecas("000001"))
+
+        cache.descartar_movimentacao(1)
+
+        self.assertIsNone(cache.obter("ana", "000001"))
+        self.assertIsNotNone(cache.obter("bruno", "000001"))
+
+    def test_descarta_a_localizacao_sem_a_entrada_da_movimentacao(self):
+        cache = PecasOrigem(ttl=60, max_usuarios=10, max_pecas=10)
+        cache.guardar("bruno", 2, "a01-01 ", self.pecas("000001"))
+        cache.guardar("carla", 3, "A01-02", self.pecas("000002"))
+
+        cache.descartar_localizacao("A01-01")
+
+        self.assertIsNone(cache.obter("bruno", "000001"))
+        self.assertIsNotNone(cache.obter("carla", "000002"))
+
+
+class IndiceLocalizacoesTests(SimpleTestCase):
+    def indice(self):
+        indice = IndiceLocalizacoes(ttl=600)
+        indice._filiais = {
+            "A01-01": ("A01-01", "MATRIZ"),
+            "B02-03": ("B02-03", "MATRIZ"),
+        }
+        indice._atualizado_em = time.monotonic()
+        return indice
+
+    def test_codigo_sem_distincao_de_maiusculas(self):
+        indice = self.indice()
+        self.assertTrue(indice.existe(" a01-01 "))
+        self.assertEqual(indice.codigo("a01-01"), "A01-01")
+        self.assertEqual(indice.filial("a01-01"), "MATRIZ")
+
+    def test_serializer_grava_o_codigo_cadastrado(self):
+        movimentacao = {
+            "data_inicio": "2024-05-06T08:30:15",
+            "data_modificacao": "2024-05-06T08:30:15",
+            "status": "Andamento",
+            "usuario": "joao",
+            "origem": " a01-01",
+            "destino": "b02-03",
+            "total_pecas": 0,
+            "pecas": [],
+        }
+        with mock.patch("app_estoque_mp.serializers.localizacoes", self.indice()):
+            serializer = MovimentacaoSerializer(data=movimentacao)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            self.assertEqual(serializer.validated_data["origem"], "A01-01")
+            self.assertEqual(serializer.validated_data["destino"], "B02-03")
+
+            serializer = MovimentacaoSerializer(
+                data=dict(movimentacao, destino="z99")
+            )
+            self.assertFalse(serializer.is_valid())
+            self.assertIn("destino", serializer.errors)
+
+
+class CatalogoMateriaisTests(SimpleTestCase):
+    def test_codigos_sem_distincao_de_maiusculas(self):
+        catalogo = CatalogoMateriais(ttl=600)
+        catalogo._materiais = {"10.01.AB01": ("TECIDO PLANO", "MT")}
+        catalogo._cores = {("10.01.AB01", "AZ1"): "AZUL"}
+        catalogo._atualizado_em = time.monotonic()
+
+        peca = {"material": "10.01.ab01 ", "cor_material": "az1", "unidade": None}
+        self.assertTrue(catalogo.descrever(peca))
+        self.assertEqual(
+            (peca["desc_material"], peca["desc_cor_material"], peca["unidade"]),
+            ("TECIDO PLANO", "AZUL", "MT"),
+        )
@@ -3,16 +3,49 @@ from .views import PecaViewSet, LocalizacaoViewSet, MovimentacaoViewSet
 
 urlpatterns = [
     path("materiais/peca/<str:peca>/", PecaViewSet.as_view({"get": "obter_peca"})),
+    path("materiais/pecas/", PecaViewSet.as_view({"post": "obter_pecas"})),
+    path(
+        "materiais/saldo/",
+        LocalizacaoViewSet.as_view({"get": "saldo_localizacoes"}),
+    ),
     path(
         "materiais/localizacao/<str:localizacao>/",
         LocalizacaoViewSet.as_view({"get": "obter_localizacao"}),
     ),
+    path(
+        "materiais/localizacao/<str:localizacao>/pecas/",
+        LocalizacaoViewSet.as_view({"get": "listar_pecas_localizacao"}),
+    ),
+    path(
+        "materiais/localizacao/<str:localizacao>/conferencia/",
+        LocalizacaoViewSet.as_view({"post": "conferir_localizacao"}),
+    ),
     path(
         "materiais/movimentacoes/",
         MovimentacaoViewSet.as_view(
             {"get": "listar_movimentacoes", "post": "criar_movimentacao"}
         ),
     ),
+    path(
+        "materiais/movimentacoes/historico/",
+        MovimentacaoViewSet.as_view({"get": "historico_movimentacoes"}),
+    ),
+    path(
+        "materiais/movimentacoes/alteracoes/",
+        MovimentacaoViewSet.as_view({"get": "alteracoes_movimentacoes"}),
+    ),
+    path(
+        "materiais/movimentacoes/sync/",
+        MovimentacaoViewSet.as_view({"post": "sincronizar_movimentacoes"}),
+    ),
+    path(
+        "materiais/movimentacoes/palete/",
+        MovimentacaoViewSet.as_view({"post": "criar_movimentacao_palete"}),
+    ),
+    path(
+        "materiais/movimentacoes/resumo_diario/",
+        MovimentacaoViewSet.as_view({"get": "resumo_diario_movimentacoes"}),
+    ),
     path(
         "materiais/movimentacoes/<int:movimentacao>/",
         MovimentacaoViewSet.as_view(
@@ -23,6 +56,20 @@ urlpatterns = [
             }
         ),
     ),
+    path(
+        "materiais/movimentacoes/<int:movimentacao>/resumo/",
+        MovimentacaoViewSet.as_view({"get": "resumo_movimentacao"}),
+    ),
+    path(
+        "materiais/movimentacoes/<int:movimentacao>/finalizacao/",
+        MovimentacaoViewSet.as_view(
+            {"get": "obter_finalizacao", "post": "reprocessar_finalizacao"}
+        ),
+    ),
+    path(
+        "materiais/movimentacoes/<int:movimentacao>/excluir_pecas/",
+        MovimentacaoViewSet.as_view({"post": "excluir_pecas_lote"}),
+    ),
     path(
         "materiais/movimentacoes/<int:movimentacao>/data_modificacao/<str:data_modificacao>/excluir_pecas/<str:pecas_ids>/",
         MovimentacaoViewSet.as_view({"delete": "excluir_pecas"}),
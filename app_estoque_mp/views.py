@@ -1,22 +1,181 @@
-from collections import defaultdict
-from datetime import datetime
+import hashlib
+import json
 import logging
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.utils import encoders
 from django.db import connections, transaction, IntegrityError
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from kingjoe.db import linhas, primeira
+from .catalogo import CAMPOS_DESCRICAO, catalogo
+from .localizacoes import localizacoes
+from .pecas_origem import pecas_origem
 from .serializers import (
+    AlteracoesMovimentacoesSerializer,
+    AlteracoesSerializer,
     AtualizarMovimentacaoSerializer,
+    ConferenciaLocalizacaoSerializer,
+    ConferenciaSerializer,
+    ConsultaPecasSerializer,
+    ExcluiPecasSerializer,
+    FiltroHistoricoSerializer,
+    FiltroPecasLocalizacaoSerializer,
+    FiltroResumoDiarioSerializer,
+    FiltroSaldoSerializer,
+    FinalizacaoSerializer,
+    HistoricoMovimentacoesSerializer,
     IncluiPecasSerializer,
     LocalizacoesSerializer,
+    MovimentacaoPaleteCriadaSerializer,
+    MovimentacaoPaleteSerializer,
     MovimentacaoSerializer,
+    OperacaoSyncSerializer,
     PecaSerializer,
+    PecasEncontradasSerializer,
+    PecasLocalizacaoSerializer,
+    PecasRejeitadasSerializer,
+    PeriodoSerializer,
+    ResumoDiarioSerializer,
+    ResumoMovimentacaoSerializer,
+    SaldoSerializer,
+    SincronizacaoRespostaSerializer,
+    SincronizacaoSerializer,
+    representar_localizacao,
+    representar_movimentacao,
+    representar_peca,
+)
+from .services import (
+    MovimentacaoService,
+    SQL_CABECALHO_MOVIMENTACAO,
+    SQL_MOVIMENTACOES_COM_ARQUIVO,
 )
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse
 
 
+# Consulta base das peças em estoque, compartilhada pela leitura unitária e em lote.
+# Descrições e unidade do material vêm do catálogo em memória (catalogo.py).
+SQL_PECAS_ESTOQUE = """
+    SELECT 
+        e.peca,
+        e.partida,
+        e.filial, 
+        e.localizacao,
+        e.material,
+        e.cor_material,
+        e.qtde AS quantidade         
+    FROM 
+        ESTOQUE_MAT_PECA e
+    LEFT JOIN 
+        MATERIAIS_LOCALIZA l ON e.localizacao = l.localizacao
+    WHERE
+        l.localizacao is not null 
+    AND e.PECA is not null 
+    AND e.PECA <> '' 
+    AND e.qtde > 0
+"""
+
+
+def gerar_etag(*partes):
+    """ETag forte a partir dos valores que identificam a versão do recurso."""
+    conteudo = "|".join(str(parte) for parte in partes)
+    return quote_etag(hashlib.sha1(conteudo.encode("utf-8")).hexdigest())
+
+
+def etag_confere(request, etag):
+    # If-None-Match usa comparação fraca: W/"x" equivale a "x"
+    etags = parse_etags(request.headers.get("If-None-Match", ""))
+    return any(atual == "*" or atual.removeprefix("W/") == etag for atual in etags)
+
+
+def nao_modificado(etag):
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+def separar_exclusoes(movimentacoes, exclusoes):
+    """
+    Divide as exclusões do feed de alterações em movimentações excluídas (peca nula)
+    e peças excluídas. Uma peça excluída e incluída de novo está entre as peças atuais
+    da movimentação devolvida no mesmo feed: a exclusão dela fica de fora, para o
+    coletor não apagar uma peça que existe.
+    """
+    excluidas = [e.movimentacao for e in exclusoes if e.peca is None]
+    ids_excluidos = set(excluidas)
+    atuais = {
+        (mov.movimentacao, peca.peca) for mov in movimentacoes for peca in mov.pecas
+    }
+    pecas_excluidas = [
+        {"movimentacao": e.movimentacao, "peca": e.peca}
+        for e in exclusoes
+        if e.peca is not None
+        and e.movimentacao not in ids_excluidos
+        and (e.movimentacao, e.peca) not in atuais
+    ]
+    return excluidas, pecas_excluidas
+
+
+def carregar_pecas_origem(usuario, movimentacao, origem):
+    """
+    Lê em uma consulta as peças da origem e as guarda no cache do usuário, para que
+    as leituras seguintes do coletor nessa origem não precisem ir ao banco.
+    """
+    try:
+        with connections["default"].cursor() as cursor:
+            cursor.execute(SQL_PECAS_ESTOQUE + " AND e.localizacao = %s", [origem])
+            pecas = []
+            for result in linhas(cursor, extras=CAMPOS_DESCRICAO, aparar=True):
+                if len(pecas) >= pecas_origem.max_pecas:
+                    # Localização grande demais para o cache: não guarda nada
+                    pecas.append(result)
+                    break
+                if catalogo.descrever(result):
+                    pecas.append(result)
+    except Exception as e:
+        # Sem o cache, obter_peca continua consultando o banco
+        logging.error(f"Erro ao carregar as peças da origem {origem}: {str(e)}")
+        pecas_origem.descartar_usuario(usuario)
+        return
+
+    pecas_origem.guardar(usuario, movimentacao, origem, pecas)
+
+
+def refletir_pecas_origem(
+    usuario, tipo, movimentacao, dados, origem=None, carregar=True
+):
+    """
+    Efeito de uma operação confirmada no cache das peças da origem: criar a
+    movimentação ou trocar a origem carrega a nova origem; finalizar descarta a
+    movimentação e a origem gravada (origem, devolvida pelo UPDATE) para todos os
+    usuários, já que as peças saíram dela; excluir não move peças, então descarta só
+    a movimentação.
+    """
+    if tipo == "criar_movimentacao":
+        if carregar:
+            carregar_pecas_origem(usuario, movimentacao, dados["origem"])
+    elif tipo == "atualizar_movimentacao":
+        if dados.get("status"):
+            pecas_origem.descartar_movimentacao(movimentacao)
+            pecas_origem.descartar_localizacao(origem)
+        elif "origem" in dados and carregar:
+            carregar_pecas_origem(usuario, movimentacao, dados["origem"])
+    elif tipo == "excluir_movimentacao":
+        pecas_origem.descartar_movimentacao(movimentacao)
+
+
+def resposta_sem_conteudo(codigo, mensagem, rejeitadas=None):
+    # Sucesso sem corpo; erros no formato {"detail": ...}, com as peças rejeitadas
+    if codigo >= 400:
+        corpo = {"detail": mensagem}
+        if rejeitadas:
+            corpo["rejeitadas"] = rejeitadas
+        return Response(corpo, status=codigo)
+    return Response(status=codigo)
+
+
 class PecaViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
@@ -34,46 +193,63 @@ class PecaViewSet(viewsets.ViewSet):
         if not peca:
             return Response({"detail": "Peca é obrigatória."}, status=400)
 
+        # Peças da origem da movimentação em andamento já estão no cache do usuário
+        result = pecas_origem.obter(request.user.get_username(), peca)
+        if result is not None:
+            return Response(representar_peca(result))
+
         with connections["default"].cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT 
-                    e.peca,
-                    e.partida,
-                    e.filial, 
-                    e.localizacao,
-                    e.material,
-                    m.desc_material,
-                    mc.cor_material,
-                    mc.desc_cor_material,
-                    m.unid_estoque AS unidade,  
-                    e.qtde AS quantidade         
-                FROM 
-                    ESTOQUE_MAT_PECA e
-                JOIN 
-                    MATERIAIS m ON e.material = m.material
-                LEFT JOIN 
-                    MATERIAIS_LOCALIZA l ON e.localizacao = l.localizacao
-                JOIN 
-                    MATERIAIS_CORES mc ON mc.MATERIAL = e.MATERIAL AND mc.COR_MATERIAL = e.COR_MATERIAL
-                WHERE
-                    l.localizacao is not null 
-                AND e.PECA is not null 
-                AND e.PECA <> '' 
-                AND e.qtde > 0
-                AND e.PECA = %s
-            """,
-                [peca],
-            )
-            columns = [col[0] for col in cursor.description]
-            row = cursor.fetchone()
-            result = dict(zip(columns, row)) if row else None
-
-        if not result:
+            cursor.execute(SQL_PECAS_ESTOQUE + " AND e.PECA = %s", [peca])
+            result = primeira(cursor, extras=CAMPOS_DESCRICAO, aparar=True)
+
+        if not result or not catalogo.descrever(result):
             return Response({"detail": "Not found."}, status=404)
 
-        serializer = PecaSerializer(result)  # Não usar many=True aqui
-        return Response(serializer.data)
+        return Response(representar_peca(result))
+
+    @extend_schema(
+        tags=["ScanMove"],
+        operation_id="obter_pecas",
+        request=ConsultaPecasSerializer,
+        responses={
+            200: PecasEncontradasSerializer(),
+            400: OpenApiTypes.OBJECT,
+        },
+    )
+    def obter_pecas(self, request):
+        serializer = ConsultaPecasSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Remove códigos repetidos mantendo a ordem em que foram lidos
+        codigos = list(dict.fromkeys(serializer.validated_data["pecas"]))
+
+        # Uma única consulta para todo o lote: os códigos seguem como um array JSON
+        # em um único parâmetro, então o plano é o mesmo para qualquer tamanho de lote
+        with connections["default"].cursor() as cursor:
+            cursor.execute(
+                SQL_PECAS_ESTOQUE
+                + """
+                AND e.PECA IN (
+                    SELECT j.peca FROM OPENJSON(%s) WITH (peca VARCHAR(6) '$') j
+                )
+                """,
+                [json.dumps(codigos)],
+            )
+            encontradas = {}
+            for result in linhas(cursor, extras=CAMPOS_DESCRICAO, aparar=True):
+                if catalogo.descrever(result):
+                    encontradas.setdefault(result.peca, result)
+
+        pecas = [encontradas[codigo] for codigo in codigos if codigo in encontradas]
+        nao_encontradas = [codigo for codigo in codigos if codigo not in encontradas]
+
+        return Response(
+            {
+                "pecas": representar_peca.lista(pecas),
+                "nao_encontradas": nao_encontradas,
+            }
+        )
 
 
 class LocalizacaoViewSet(viewsets.ViewSet):
@@ -92,262 +268,439 @@ class LocalizacaoViewSet(viewsets.ViewSet):
         responses={200: LocalizacoesSerializer()},
     )
     def obter_localizacao(self, request, localizacao=None):
-        if not localizacao:
+        if not localizacao or not localizacoes.existe(localizacao):
+            return Response({"detail": "Not found."}, status=404)
+
+        response = Response(
+            representar_localizacao(
+                {
+                    "localizacao": localizacoes.codigo(localizacao),
+                    "filial": localizacoes.filial(localizacao),
+                }
+            )
+        )
+        # As localizações mudam pouco: o coletor pode reaproveitar a resposta pelo
+        # mesmo intervalo em que o índice em memória é recarregado
+        patch_cache_control(response, private=True, max_age=localizacoes.ttl)
+        return response
+
+    @extend_schema(
+        tags=["ScanMove"],
+        operation_id="listar_pecas_localizacao",
+        parameters=[
+            OpenApiParameter(
+                name="localizacao",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.PATH,
+            ),
+            FiltroPecasLocalizacaoSerializer,
+        ],
+        responses={
+            200: PecasLocalizacaoSerializer(),
+            400: OpenApiTypes.OBJECT,
+            404: OpenApiTypes.OBJECT,
+        },
+    )
+    def listar_pecas_localizacao(self, request, localizacao=None):
+        if not localizacao or not localizacoes.existe(localizacao):
             return Response({"detail": "Not found."}, status=404)
 
+        filtro = FiltroPecasLocalizacaoSerializer(data=request.query_params)
+        if not filtro.is_valid():
+            return Response(filtro.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        limite = filtro.validated_data["limite"]
+
+        # Paginação por seek no código da peça, apoiada no índice
+        # IX_ESTOQUE_MAT_PECA_LOCALIZACAO_PECA: cada página é uma leitura de faixa
         with connections["default"].cursor() as cursor:
             cursor.execute(
-                """
-                SELECT 
-                    l.localizacao, 
-                    l.filial
-                FROM 
-                    MATERIAIS_LOCALIZA l 
-                WHERE 
-                    l.localizacao = %s
-            """,
-                [localizacao],
+                f"""
+                SELECT TOP (%s) p.*
+                FROM (
+                    {SQL_PECAS_ESTOQUE}
+                    AND e.localizacao = %s
+                    AND e.PECA > %s
+                ) p
+                ORDER BY p.peca
+                """,
+                [
+                    limite + 1,
+                    localizacao.strip(),
+                    filtro.validated_data.get("cursor", ""),
+                ],
             )
-            columns = [col[0] for col in cursor.description]
-            results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            pecas = list(linhas(cursor, extras=CAMPOS_DESCRICAO, aparar=True))
+
+        # Um item a mais indica se existe a próxima página
+        tem_mais = len(pecas) > limite
+        pecas = pecas[:limite]
+        proximo = (
+            FiltroPecasLocalizacaoSerializer.gerar_cursor(pecas[-1].peca)
+            if tem_mais
+            else None
+        )
 
-        if not results:
+        # Peças com material ou cor fora do catálogo continuam na listagem, com as
+        # descrições nulas, como em conferir_localizacao: a página mostra o estoque real
+        por_peca = {}
+        for result in pecas:
+            catalogo.descrever(result)
+            por_peca.setdefault(result.peca, result)
+
+        return Response(
+            {
+                "resultados": representar_peca.lista(por_peca.values()),
+                "proximo": proximo,
+            }
+        )
+
+    @extend_schema(
+        tags=["ScanMove"],
+        operation_id="conferir_localizacao",
+        parameters=[
+            OpenApiParameter(
+                name="localizacao",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.PATH,
+            )
+        ],
+        request=ConferenciaSerializer,
+        responses={
+            200: ConferenciaLocalizacaoSerializer(),
+            400: OpenApiTypes.OBJECT,
+            404: OpenApiTypes.OBJECT,
+        },
+    )
+    def conferir_localizacao(self, request, localizacao=None):
+        if not localizacao or not localizacoes.existe(localizacao):
             return Response({"detail": "Not found."}, status=404)
 
-        # Retornar apenas o primeiro item da lista de resultados
-        serializer = LocalizacoesSerializer(results[0])
-        return Response(serializer.data)
+        serializer = ConferenciaSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        with connections["default"].cursor() as cursor:
+            conferencia = MovimentacaoService().conferir_localizacao(
+                cursor, localizacao.strip(), serializer.validated_data["pecas"]
+            )
+
+        conferencia["faltantes"] = representar_peca.lista(conferencia["faltantes"])
+        conferencia["excedentes"] = representar_peca.lista(conferencia["excedentes"])
+        return Response(conferencia)
+
+    @extend_schema(
+        tags=["ScanMove"],
+        operation_id="saldo_localizacoes",
+        parameters=[FiltroSaldoSerializer],
+        responses={200: SaldoSerializer(many=True), 400: OpenApiTypes.OBJECT},
+    )
+    def saldo_localizacoes(self, request):
+        filtro = FiltroSaldoSerializer(data=request.query_params)
+        if not filtro.is_valid():
+            return Response(filtro.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        with connections["default"].cursor() as cursor:
+            saldo = MovimentacaoService().consultar_saldo(
+                cursor, **filtro.validated_data
+            )
+
+        return Response(SaldoSerializer(saldo, many=True).data)
 
 
 class MovimentacaoViewSet(viewsets.ViewSet):
     serializer_class = MovimentacaoSerializer
     permission_classes = [IsAuthenticated]
 
+    # Consultas das movimentações de todos os usuários: só para supervisores (is_staff)
+    acoes_supervisor = ("historico_movimentacoes", "resumo_diario_movimentacoes")
+
+    def get_permissions(self):
+        if self.action in self.acoes_supervisor:
+            return [IsAuthenticated(), IsAdminUser()]
+        return super().get_permissions()
+
     @extend_schema(
         tags=["ScanMove"],
         operation_id="listar_movimentacoes",
-        responses={200: MovimentacaoSerializer(many=True)},
+        parameters=[
+            OpenApiParameter(
+                name="data_de",
+                type=OpenApiTypes.DATE,
+                location=OpenApiParameter.QUERY,
+                description="Início do período (padrão: data_ate ou a data atual).",
+            ),
+            OpenApiParameter(
+                name="data_ate",
+                type=OpenApiTypes.DATE,
+                location=OpenApiParameter.QUERY,
+                description="Fim do período, inclusive (padrão: data_de).",
+            ),
+            OpenApiParameter(
+                name="stream",
+                type=OpenApiTypes.BOOL,
+                location=OpenApiParameter.QUERY,
+                description="Envia a lista em streaming, uma movimentação por vez.",
+            ),
+        ],
+        responses={
+            200: MovimentacaoSerializer(many=True),
+            304: OpenApiResponse(description="Lista não modificada (If-None-Match)."),
+        },
     )
     def listar_movimentacoes(self, request):
-        username = request.user.username  # Obtém o username do usuário autenticado
-        data_atual = datetime.now().strftime(
-            "%Y-%m-%d"
-        )  # Obtém a data atual no formato YYYY-MM-DD
+        filtro = PeriodoSerializer(data=request.query_params)
+        if not filtro.is_valid():
+            return Response(filtro.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Obtém o username do usuário autenticado
+        username = request.user.get_username()
+        inicio, fim = filtro.intervalo()
+
+        # Cada ramo do UNION filtra por colunas puras (usuario + intervalo semiaberto de
+        # data_inicio / usuario + status), o que permite seek nos índices; os valores
+        # seguem como parâmetros para o plano ser reaproveitado entre usuários e dias
+        movs = """
+            WITH movs AS (
+                SELECT movimentacao
+                FROM dbo.KING_ESTOQUE_MAT_MOV
+                WHERE usuario = %s AND data_inicio >= %s AND data_inicio < %s
+                UNION
+                SELECT movimentacao
+                FROM dbo.KING_ESTOQUE_MAT_MOV
+                WHERE usuario = %s AND status IN ('Andamento', 'Finalizando')
+            )
+        """
+        params = [username, inicio, fim, username]
+
+        # Sonda barata (só agregados do cabeçalho) para responder 304 sem a leitura
+        # completa. A versão é a ROWVERSION atribuída pelo servidor a cada alteração, e
+        # não a data_modificacao enviada pelo coletor, que a sincronização offline
+        # reaplica como veio; a contagem cobre as movimentações que saíram da lista
+        with connections["default"].cursor() as cursor:
+            cursor.execute(
+                movs
+                + """
+                SELECT
+                    COUNT(*) AS total,
+                    MAX(CAST(m.versao AS BIGINT)) AS versao
+                FROM 
+                    movs
+                JOIN 
+                    dbo.KING_ESTOQUE_MAT_MOV m ON m.movimentacao = movs.movimentacao
+                """,
+                params,
+            )
+            sonda = primeira(cursor)
+
+        etag = gerar_etag(username, inicio, fim, sonda.total, sonda.versao)
+        if etag_confere(request, etag):
+            return nao_modificado(etag)
 
         query = f"""
-            SELECT 
-                m.movimentacao,
-                m.data_inicio,
-                m.data_modificacao,
-                m.status,
-                m.usuario,
-                m.origem,
-                loc_origem.filial AS filial_origem,
-                m.destino,
-                loc_destino.filial AS filial_destino,
-                m.total_pecas,
-                mp.peca,
-                mp.partida,
-                mp.material,
-                mat.desc_material,
-                mp.cor_material,
-                mc.desc_cor_material,
-                mp.unidade,
-                mp.quantidade,
-                ep.localizacao, 
-                ep.filial
+            {movs}
+            SELECT {SQL_CABECALHO_MOVIMENTACAO}
             FROM 
-                dbo.KING_ESTOQUE_MAT_MOV m
-            LEFT JOIN 
-                MATERIAIS_LOCALIZA loc_origem ON m.origem = loc_origem.localizacao
-            LEFT JOIN 
-                MATERIAIS_LOCALIZA loc_destino ON m.destino = loc_destino.localizacao
-            LEFT JOIN 
-                dbo.KING_ESTOQUE_MAT_MOV_PECA mp ON m.movimentacao = mp.movimentacao
-            LEFT JOIN 
-                MATERIAIS mat ON mp.material = mat.material
-            LEFT JOIN 
-                MATERIAIS_CORES mc ON mp.material = mc.material AND mp.cor_material = mc.cor_material
-            LEFT JOIN 
-                ESTOQUE_MAT_PECA ep ON ep.PECA = mp.PECA
-            WHERE 
-                m.USUARIO = '{username}' 
-                AND (
-                    CONVERT(DATE, m.DATA_INICIO) = '{data_atual}'  -- Movimentações do dia atual
-                    OR m.status = 'Andamento'                      -- Ou movimentações em andamento
-                )
+                movs
+            JOIN 
+                dbo.KING_ESTOQUE_MAT_MOV m ON m.movimentacao = movs.movimentacao
             ORDER BY 
-                m.status
+                m.status, m.movimentacao
         """
 
+        if request.query_params.get("stream") in ("1", "true", "True"):
+            response = StreamingHttpResponse(
+                self._stream_movimentacoes(query, params),
+                content_type="application/json",
+            )
+            response["ETag"] = etag
+            return response
+
         with connections["default"].cursor() as cursor:
-            cursor.execute(query)
-            columns = [col[0] for col in cursor.description]
-            results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-
-        # Estrutura para armazenar as movimentações
-        movimentacoes = defaultdict(
-            lambda: {
-                "movimentacao": None,
-                "data_inicio": None,
-                "data_modificacao": None,
-                "status": None,
-                "usuario": None,
-                "origem": None,
-                "destino": None,
-                "total_pecas": None,
-                "filial_origem": None,
-                "filial_destino": None,
-                "pecas": [],
-            }
+            movimentacoes = MovimentacaoService().carregar_movimentacoes(
+                cursor, query, params
+            )
+
+        return Response(
+            representar_movimentacao.lista(movimentacoes), headers={"ETag": etag}
         )
 
-        # Preenchimento das movimentações e suas respectivas peças
-        for result in results:
-            mov_id = result["movimentacao"]
-            if movimentacoes[mov_id]["movimentacao"] is None:
-                movimentacoes[mov_id].update(
-                    {
-                        "movimentacao": result["movimentacao"],
-                        "data_inicio": result["data_inicio"],
-                        "data_modificacao": result["data_modificacao"],
-                        "status": result["status"],
-                        "usuario": result["usuario"],
-                        "origem": result["origem"],
-                        "destino": result["destino"],
-                        "total_pecas": result["total_pecas"],
-                        "filial_origem": result["filial_origem"],
-                        "filial_destino": result["filial_destino"],
-                    }
+    def _stream_movimentacoes(self, query, params):
+        # Escreve o array JSON aos poucos: cada movimentação é serializada e enviada
+        # assim que suas peças são lidas, então a memória fica limitada a uma por vez
+        yield b"["
+        with connections["default"].cursor() as cursor:
+            movimentacoes = MovimentacaoService().iterar_movimentacoes(
+                cursor, query, params
+            )
+            for indice, movimentacao in enumerate(movimentacoes):
+                dados = json.dumps(
+                    representar_movimentacao(movimentacao),
+                    cls=encoders.JSONEncoder,
+                    ensure_ascii=False,
+                    separators=(",", ":"),
                 )
+                yield (("," if indice else "") + dados).encode("utf-8")
+        yield b"]"
 
-            movimentacoes[mov_id]["pecas"].append(
-                {
-                    "peca": result["peca"],
-                    "partida": result["partida"],
-                    "material": result["material"],
-                    "desc_material": result["desc_material"],
-                    "cor_material": result["cor_material"],
-                    "desc_cor_material": result["desc_cor_material"],
-                    "unidade": result["unidade"],
-                    "quantidade": result["quantidade"],
-                    "localizacao": result["localizacao"],
-                    "filial": result["filial"],
-                }
+    @extend_schema(
+        tags=["ScanMove"],
+        operation_id="historico_movimentacoes",
+        parameters=[FiltroHistoricoSerializer],
+        responses={
+            200: HistoricoMovimentacoesSerializer(),
+            400: OpenApiTypes.OBJECT,
+            403: OpenApiResponse(description="Disponível só para supervisores."),
+        },
+    )
+    def historico_movimentacoes(self, request):
+        filtro = FiltroHistoricoSerializer(data=request.query_params)
+        if not filtro.is_valid():
+            return Response(filtro.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        filtros = filtro.validated_data
+
+        with connections["default"].cursor() as cursor:
+            movimentacoes, tem_mais = MovimentacaoService().listar_historico(
+                cursor, filtros, filtros["limite"], filtros.get("cursor")
             )
 
-        movimentacoes_list = list(movimentacoes.values())
-        serializer = MovimentacaoSerializer(movimentacoes_list, many=True)
-        return Response(serializer.data)
+        return Response(
+            {
+                "resultados": representar_movimentacao.lista(movimentacoes),
+                "proximo": (
+                    FiltroHistoricoSerializer.gerar_cursor(movimentacoes[-1])
+                    if tem_mais
+                    else None
+                ),
+            }
+        )
+
+    @extend_schema(
+        tags=["ScanMove"],
+        operation_id="resumo_movimentacao",
+        responses={200: ResumoMovimentacaoSerializer(), 404: OpenApiTypes.OBJECT},
+    )
+    def resumo_movimentacao(self, request, movimentacao=None):
+        # Como em obter_movimentacao, só o dono vê a movimentação; supervisores, todas
+        usuario = None if request.user.is_staff else request.user.get_username()
+        with connections["default"].cursor() as cursor:
+            resumo = MovimentacaoService().resumir_movimentacao(
+                cursor, movimentacao, usuario
+            )
+
+        if resumo is None:
+            return Response(
+                {"detail": "Movimentação não encontrada."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        cabecalho, itens = resumo
+        return Response(
+            ResumoMovimentacaoSerializer(dict(cabecalho.as_dict(), itens=itens)).data
+        )
+
+    @extend_schema(
+        tags=["ScanMove"],
+        operation_id="resumo_diario_movimentacoes",
+        parameters=[FiltroResumoDiarioSerializer],
+        responses={
+            200: ResumoDiarioSerializer(many=True),
+            400: OpenApiTypes.OBJECT,
+            403: OpenApiResponse(description="Disponível só para supervisores."),
+        },
+    )
+    def resumo_diario_movimentacoes(self, request):
+        filtro = FiltroResumoDiarioSerializer(data=request.query_params)
+        if not filtro.is_valid():
+            return Response(filtro.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        inicio, fim = filtro.intervalo()
+        with connections["default"].cursor() as cursor:
+            resumo = MovimentacaoService().resumo_diario(
+                cursor, inicio, fim, filtro.validated_data.get("usuario")
+            )
+
+        return Response(ResumoDiarioSerializer(resumo, many=True).data)
+
+    @extend_schema(
+        tags=["ScanMove"],
+        operation_id="alteracoes_movimentacoes",
+        parameters=[AlteracoesSerializer],
+        responses={
+            200: AlteracoesMovimentacoesSerializer(),
+            400: OpenApiTypes.OBJECT,
+        },
+    )
+    def alteracoes_movimentacoes(self, request):
+        filtro = AlteracoesSerializer(data=request.query_params)
+        if not filtro.is_valid():
+            return Response(filtro.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        desde, versao = filtro.validated_data["desde"]
+
+        with connections["default"].cursor() as cursor:
+            movimentacoes, exclusoes, proxima = MovimentacaoService().listar_alteracoes(
+                cursor, request.user.get_username(), desde, versao
+            )
+
+        excluidas, pecas_excluidas = separar_exclusoes(movimentacoes, exclusoes)
+
+        token = AlteracoesSerializer.gerar_token(proxima)
+
+        return Response(
+            {
+                "movimentacoes": representar_movimentacao.lista(movimentacoes),
+                "excluidas": excluidas,
+                "pecas_excluidas": pecas_excluidas,
+                "token": token,
+            }
+        )
 
     @extend_schema(
         tags=["ScanMove"],
         operation_id="obter_movimentacao",
-        responses={200: MovimentacaoSerializer()},
+        responses={
+            200: MovimentacaoSerializer(),
+            304: OpenApiResponse(
+                description="Movimentação não modificada (If-None-Match)."
+            ),
+            404: OpenApiResponse(description="Movimentação não encontrada."),
+        },
     )
     def obter_movimentacao(self, request, movimentacao=None):
-        username = request.user.username  # Obtém o username do usuário autenticado
-
-        query = """
-            SELECT 
-                m.movimentacao,
-                m.data_inicio,
-                m.data_modificacao,
-                m.status,
-                m.usuario,
-                m.origem,
-                loc_origem.filial AS filial_origem,
-                m.destino,
-                loc_destino.filial AS filial_destino,
-                m.total_pecas,
-                mp.peca,
-                mp.partida,
-                mp.material,
-                mat.desc_material,
-                mp.cor_material,
-                mc.desc_cor_material,
-                mp.unidade,
-                mp.quantidade,
-                ep.localizacao, 
-                ep.filial
+        # Obtém o username do usuário autenticado
+        username = request.user.get_username()
+
+        query = f"""
+            SELECT {SQL_CABECALHO_MOVIMENTACAO}, m.versao
             FROM 
-                dbo.KING_ESTOQUE_MAT_MOV m
-            LEFT JOIN 
-                MATERIAIS_LOCALIZA loc_origem ON m.origem = loc_origem.localizacao
-            LEFT JOIN 
-                MATERIAIS_LOCALIZA loc_destino ON m.destino = loc_destino.localizacao
-            LEFT JOIN 
-                dbo.KING_ESTOQUE_MAT_MOV_PECA mp ON m.movimentacao = mp.movimentacao
-            LEFT JOIN 
-                MATERIAIS mat ON mp.material = mat.material
-            LEFT JOIN 
-                MATERIAIS_CORES mc ON mp.material = mc.material AND mp.cor_material = mc.cor_material
-            LEFT JOIN 
-                ESTOQUE_MAT_PECA ep ON ep.PECA = mp.PECA
+                {SQL_MOVIMENTACOES_COM_ARQUIVO} m
             WHERE 
                 m.USUARIO = %s 
                 AND m.movimentacao = %s
         """
 
         with connections["default"].cursor() as cursor:
-            cursor.execute(query, [username, movimentacao])
-            columns = [col[0] for col in cursor.description]
-            results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-
-        if not results:
-            return Response(
-                {"detail": "Movimentação não encontrada."},
-                status=status.HTTP_404_NOT_FOUND,
+            # A VERSAO do cabeçalho sozinha já define a ETag (nula depois de arquivada,
+            # quando a movimentação não muda mais); as peças só são lidas se ela mudou
+            cabecalhos = MovimentacaoService().carregar_cabecalhos(
+                cursor, query, [username, movimentacao]
             )
 
-        movimentacao = {
-            "movimentacao": None,
-            "data_inicio": None,
-            "data_modificacao": None,
-            "status": None,
-            "usuario": None,
-            "origem": None,
-            "destino": None,
-            "total_pecas": None,
-            "filial_origem": None,
-            "filial_destino": None,
-            "pecas": [],
-        }
-
-        for result in results:
-            if movimentacao["movimentacao"] is None:
-                movimentacao.update(
-                    {
-                        "movimentacao": result["movimentacao"],
-                        "data_inicio": result["data_inicio"],
-                        "data_modificacao": result["data_modificacao"],
-                        "status": result["status"],
-                        "usuario": result["usuario"],
-                        "origem": result["origem"],
-                        "destino": result["destino"],
-                        "total_pecas": result["total_pecas"],
-                        "filial_origem": result["filial_origem"],
-                        "filial_destino": result["filial_destino"],
-                    }
+            if not cabecalhos:
+                return Response(
+                    {"detail": "Movimentação não encontrada."},
+                    status=status.HTTP_404_NOT_FOUND,
                 )
 
-            movimentacao["pecas"].append(
-                {
-                    "peca": result["peca"],
-                    "partida": result["partida"],
-                    "material": result["material"],
-                    "desc_material": result["desc_material"],
-                    "cor_material": result["cor_material"],
-                    "desc_cor_material": result["desc_cor_material"],
-                    "unidade": result["unidade"],
-                    "quantidade": result["quantidade"],
-                    "localizacao": result["localizacao"],
-                    "filial": result["filial"],
-                }
-            )
+            etag = gerar_etag(cabecalhos[0].movimentacao, cabecalhos[0].versao)
+            if etag_confere(request, etag):
+                return nao_modificado(etag)
+
+            MovimentacaoService().anexar_pecas(cursor, cabecalhos, arquivo=True)
 
-        serializer = MovimentacaoSerializer(movimentacao)
-        return Response(serializer.data)
+        return Response(representar_movimentacao(cabecalhos[0]), headers={"ETag": etag})
 
     @extend_schema(
         tags=["ScanMove"],
@@ -355,7 +708,10 @@ class MovimentacaoViewSet(viewsets.ViewSet):
         request=MovimentacaoSerializer,
         responses={
             201: OpenApiTypes.OBJECT,
-            400: OpenApiTypes.OBJECT,
+            400: OpenApiResponse(
+                response=PecasRejeitadasSerializer(),
+                description="Dados inválidos ou peças rejeitadas.",
+            ),
         },
     )
     def criar_movimentacao(self, request):
@@ -364,56 +720,22 @@ class MovimentacaoViewSet(viewsets.ViewSet):
         if not serializer.is_valid():
             return Response(serializer.errors, status=400)
 
-        data = serializer.validated_data
-
         try:
-            with transaction.atomic():
-                with connections["default"].cursor() as cursor:
-                    # Inserir a movimentação e obter o ID usando OUTPUT INSERTED
-                    cursor.execute(
-                        """
-                        INSERT INTO KING_ESTOQUE_MAT_MOV (
-                            data_inicio, data_modificacao, status, usuario,
-                            origem, destino, total_pecas
-                        ) 
-                        OUTPUT INSERTED.MOVIMENTACAO
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """,
-                        [
-                            data["data_inicio"],
-                            data["data_modificacao"],
-                            data["status"],
-                            data["usuario"],
-                            data["origem"],
-                            data.get("destino"),
-                            data["total_pecas"],
-                        ],
-                    )
-                    movimentacao_id = cursor.fetchone()[0]
-
-                    # Insere os pecas relacionados à movimentação
-                    for peca in data.get("pecas", []):
-                        cursor.execute(
-                            """
-                            INSERT INTO KING_ESTOQUE_MAT_MOV_PECA (
-                                movimentacao, peca, partida, material, cor_material,
-                                unidade, quantidade
-                            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        """,
-                            [
-                                movimentacao_id,
-                                peca["peca"],
-                                peca["partida"],
-                                peca["material"],
-                                peca["cor_material"],
-                                peca["unidade"],
-                                peca["quantidade"],
-                            ],
-                        )
+            with transaction.atomic(), connections["default"].cursor() as cursor:
+                codigo, mensagem, dados = MovimentacaoService().criar_movimentacao(
+                    cursor, serializer.validated_data
+                )
 
-            return Response(
-                {"mov_servidor": movimentacao_id, "status": "sucesso"}, status=201
+            if codigo >= 400:
+                return resposta_sem_conteudo(codigo, mensagem, dados)
+
+            refletir_pecas_origem(
+                request.user.get_username(),
+                "criar_movimentacao",
+                dados,
+                serializer.validated_data,
             )
+            return Response({"mov_servidor": dados, "status": "sucesso"}, status=codigo)
 
         except IntegrityError as e:
             return Response({"detail": str(e)}, status=400)
@@ -421,6 +743,104 @@ class MovimentacaoViewSet(viewsets.ViewSet):
         except Exception as e:
             return Response({"detail": str(e)}, status=500)
 
+    @extend_schema(
+        tags=["ScanMove"],
+        operation_id="criar_movimentacao_palete",
+        request=MovimentacaoPaleteSerializer,
+        responses={
+            201: MovimentacaoPaleteCriadaSerializer(),
+            202: MovimentacaoPaleteCriadaSerializer(),
+            400: OpenApiTypes.OBJECT,
+        },
+    )
+    def criar_movimentacao_palete(self, request):
+        serializer = MovimentacaoPaleteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic(), connections["default"].cursor() as cursor:
+                (
+                    codigo,
+                    mensagem,
+                    dados,
+                ) = MovimentacaoService().criar_movimentacao_palete(
+                    cursor, serializer.validated_data
+                )
+
+            if codigo >= 400:
+                return resposta_sem_conteudo(codigo, mensagem)
+
+            if dados["status"] != "Andamento":
+                pecas_origem.descartar_localizacao(serializer.validated_data["origem"])
+            return Response(dados, status=codigo)
+
+        except Exception as e:
+            return Response(
+                {"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @extend_schema(
+        tags=["ScanMove"],
+        operation_id="sincronizar_movimentacoes",
+        request=SincronizacaoSerializer,
+        responses={
+            200: SincronizacaoRespostaSerializer(),
+            400: OpenApiTypes.OBJECT,
+        },
+    )
+    def sincronizar_movimentacoes(self, request):
+        serializer = SincronizacaoSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        operacoes = [
+            OperacaoSyncSerializer.preparar(op)
+            for op in serializer.validated_data["operacoes"]
+        ]
+
+        usuario = request.user.get_username()
+        try:
+            # Um lote, uma transação; cada operação tem o seu savepoint
+            with transaction.atomic(), connections["default"].cursor() as cursor:
+                resultados, aplicadas = MovimentacaoService().sincronizar(
+                    cursor, usuario, operacoes
+                )
+        except Exception as e:
+            return Response(
+                {"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        # Os mesmos efeitos no cache das peças da origem das operações avulsas, em
+        # ordem. O cache guarda uma origem por usuário, então só a última carga do lote
+        # é feita: as anteriores seriam substituídas por ela
+        cargas = [
+            i
+            for i, (tipo, _, dados, _) in enumerate(aplicadas)
+            if tipo == "criar_movimentacao"
+            or (
+                tipo == "atualizar_movimentacao"
+                and not dados.get("status")
+                and "origem" in dados
+            )
+        ]
+        for i, (tipo, movimentacao, dados, origem) in enumerate(aplicadas):
+            refletir_pecas_origem(
+                usuario,
+                tipo,
+                movimentacao,
+                dados,
+                origem,
+                carregar=bool(cargas) and i == cargas[-1],
+            )
+
+        mapeamento = {
+            resultado["id_cliente"]: resultado["movimentacao"]
+            for resultado in resultados
+            if resultado["tipo"] == "criar_movimentacao" and resultado["status"] < 400
+        }
+        return Response({"resultados": resultados, "mapeamento": mapeamento})
+
     @extend_schema(
         tags=["ScanMove"],
         operation_id="atualizar_movimentacao",
@@ -434,6 +854,9 @@ class MovimentacaoViewSet(viewsets.ViewSet):
         ],
         responses={
             200: OpenApiResponse(description="Movimentação Atualizada com sucesso."),
+            202: OpenApiResponse(
+                description="Finalização agendada (assincrono=True); acompanhe em finalizacao/."
+            ),
             400: OpenApiResponse(description="Erro na atualização"),
             404: OpenApiResponse(description="Movimentação não encontrada"),
             500: OpenApiResponse(description="Erro interno do servidor"),
@@ -445,87 +868,22 @@ class MovimentacaoViewSet(viewsets.ViewSet):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        data = serializer.validated_data
-
         try:
-            # Verifica se a movimentação existe e obtém o status, origem e destino atuais
-            with connections["default"].cursor() as cursor:
-                cursor.execute(
-                    "SELECT status, origem, destino FROM KING_ESTOQUE_MAT_MOV WHERE movimentacao = %s",
-                    [movimentacao],
+            with transaction.atomic(), connections["default"].cursor() as cursor:
+                codigo, mensagem, origem = MovimentacaoService().atualizar_movimentacao(
+                    cursor, movimentacao, serializer.validated_data
                 )
-                resultado = cursor.fetchone()
-
-                if resultado is None:
-                    return Response(
-                        {"detail": "Movimentação não encontrada."},
-                        status=status.HTTP_404_NOT_FOUND,
-                    )
-
-                status_atual, origem_atual, destino_atual = resultado
-
-                # Verifica se a movimentação já está finalizada
-                if status_atual == "Finalizada":
-                    return Response(
-                        {
-                            "detail": "A movimentação já está finalizada e não pode ser alterada."
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                # Preparando os dados para atualização
-                fields_to_update = []
-                params = []
-
-                if "origem" in data:
-                    fields_to_update.append("origem = %s")
-                    params.append(data["origem"])
-                if "destino" in data:
-                    fields_to_update.append("destino = %s")
-                    params.append(data["destino"])
-                if "status" in data and data["status"] == True:
-                    fields_to_update.append("status = %s")
-                    params.append("Finalizada")
-
-                    # Atualizar a localizacao em ESTOQUE_MAT_PECA para todas as peças associadas à movimentação
-                    try:
-                        cursor.execute(
-                            """
-                            UPDATE ESTOQUE_MAT_PECA
-                            SET localizacao = mv.destino
-                            FROM ESTOQUE_MAT_PECA ep
-                            INNER JOIN KING_ESTOQUE_MAT_MOV_PECA mp ON ep.peca = mp.PECA
-                            INNER JOIN KING_ESTOQUE_MAT_MOV mv ON mp.MOVIMENTACAO = mv.MOVIMENTACAO
-                            WHERE mv.movimentacao = %s;
-                            """,
-                            [movimentacao],
-                        )
-                        logging.info(
-                            f"ScanMove atualizado para movimentacao {movimentacao}"
-                        )
-                    except Exception as e:
-                        logging.error(
-                            f"Erro ao atualizar o ScanMove: {str(e)}"
-                        )
-                        raise
-
-                # A data_modificacao deve sempre estar presente e ser atualizada
-                fields_to_update.append("data_modificacao = %s")
-                params.append(data["data_modificacao"])
-
-                if fields_to_update:
-                    query = f"""
-                        UPDATE KING_ESTOQUE_MAT_MOV
-                        SET {', '.join(fields_to_update)}
-                        WHERE movimentacao = %s
-                    """
-                    params.append(movimentacao)
-                    cursor.execute(query, params)
 
-            return Response(
-                {"detail": "Movimentação atualizada com sucesso."},
-                status=status.HTTP_200_OK,
-            )
+            if codigo < 300:
+                refletir_pecas_origem(
+                    request.user.get_username(),
+                    "atualizar_movimentacao",
+                    movimentacao,
+                    serializer.validated_data,
+                    origem,
+                )
+
+            return Response({"detail": mensagem}, status=codigo)
 
         except Exception as e:
             return Response(
@@ -533,6 +891,47 @@ class MovimentacaoViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    @extend_schema(
+        tags=["ScanMove"],
+        operation_id="obter_finalizacao",
+        responses={200: FinalizacaoSerializer(), 404: OpenApiTypes.OBJECT},
+    )
+    def obter_finalizacao(self, request, movimentacao=None):
+        with connections["default"].cursor() as cursor:
+            finalizacao = MovimentacaoService().obter_finalizacao(cursor, movimentacao)
+
+        if finalizacao is None:
+            return Response(
+                {"detail": "Finalização não encontrada."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        return Response(FinalizacaoSerializer(finalizacao).data)
+
+    @extend_schema(
+        tags=["ScanMove"],
+        operation_id="reprocessar_finalizacao",
+        request=None,
+        responses={
+            202: OpenApiTypes.OBJECT,
+            400: OpenApiTypes.OBJECT,
+            404: OpenApiTypes.OBJECT,
+        },
+    )
+    def reprocessar_finalizacao(self, request, movimentacao=None):
+        try:
+            with transaction.atomic(), connections["default"].cursor() as cursor:
+                codigo, mensagem, _ = MovimentacaoService().reprocessar_finalizacao(
+                    cursor, movimentacao
+                )
+
+            return Response({"detail": mensagem}, status=codigo)
+
+        except Exception as e:
+            return Response(
+                {"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
     @extend_schema(
         tags=["ScanMove"],
         operation_id="excluir_movimentacao",
@@ -553,42 +952,19 @@ class MovimentacaoViewSet(viewsets.ViewSet):
             )
 
         try:
-            with connections["default"].cursor() as cursor:
-                # Verifica se a movimentação existe e qual é o seu status
-                cursor.execute(
-                    """
-                    SELECT status FROM KING_ESTOQUE_MAT_MOV WHERE movimentacao = %s
-                """,
-                    [movimentacao],
-                )
-                result = cursor.fetchone()
-
-                if not result:
-                    return Response(
-                        {"detail": "Movimentação não encontrada."},
-                        status=status.HTTP_404_NOT_FOUND,
-                    )
-
-                status_movimentacao = result[0]
-
-                # Verifica se o status é 'Finalizada'
-                if status_movimentacao == "Finalizada":
-                    return Response(
-                        {
-                            "detail": "A movimentação já está finalizada e não pode ser excluída."
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                # Exclui a movimentação (pecas relacionados serão excluídos automaticamente)
-                cursor.execute(
-                    """
-                    DELETE FROM KING_ESTOQUE_MAT_MOV WHERE movimentacao = %s
-                """,
-                    [movimentacao],
+            with transaction.atomic(), connections["default"].cursor() as cursor:
+                codigo, mensagem, _ = MovimentacaoService().excluir_movimentacao(
+                    cursor, movimentacao
                 )
 
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            if codigo < 300:
+                refletir_pecas_origem(
+                    request.user.get_username(),
+                    "excluir_movimentacao",
+                    movimentacao,
+                    None,
+                )
+            return resposta_sem_conteudo(codigo, mensagem)
 
         except Exception as e:
             return Response(
@@ -599,7 +975,7 @@ class MovimentacaoViewSet(viewsets.ViewSet):
         tags=["ScanMove"],
         operation_id="incluir_pecas",
         request=IncluiPecasSerializer,
-        responses={201: None},
+        responses={201: None, 400: PecasRejeitadasSerializer()},
     )
     @action(detail=True, methods=["post"], url_path="incluir_pecas")
     def incluir_pecas(self, request, movimentacao=None):
@@ -611,61 +987,39 @@ class MovimentacaoViewSet(viewsets.ViewSet):
         data_modificacao = serializer.validated_data.get("data_modificacao")
 
         try:
-            with connections["default"].cursor() as cursor:
-                # Verifica se a movimentação existe e obtém o status atual
-                cursor.execute(
-                    "SELECT status FROM KING_ESTOQUE_MAT_MOV WHERE movimentacao = %s",
-                    [movimentacao],
+            with transaction.atomic(), connections["default"].cursor() as cursor:
+                codigo, mensagem, rejeitadas = MovimentacaoService().incluir_pecas(
+                    cursor, movimentacao, pecas_para_incluir, data_modificacao
                 )
-                resultado = cursor.fetchone()
-
-                if resultado is None:
-                    return Response(
-                        {"detail": "Movimentação não encontrada."},
-                        status=status.HTTP_404_NOT_FOUND,
-                    )
-
-                status_atual = resultado[0]
-
-                # Verifica se a movimentação já está finalizada
-                if status_atual == "Finalizada":
-                    return Response(
-                        {
-                            "detail": "A movimentação já está finalizada e não pode ser alterada."
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                # Insere as peças especificadas
-                for peca in pecas_para_incluir:
-                    cursor.execute(
-                        """
-                        INSERT INTO KING_ESTOQUE_MAT_MOV_PECA (
-                            movimentacao, peca, partida, material, cor_material, unidade, quantidade
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        """,
-                        [
-                            movimentacao,
-                            peca["peca"],
-                            peca["partida"],
-                            peca["material"],
-                            peca["cor_material"],
-                            peca["unidade"],
-                            peca["quantidade"],
-                        ],
-                    )
-
-                # Atualiza a 'data_modificacao' da movimentação
-                cursor.execute(
-                    """
-                    UPDATE KING_ESTOQUE_MAT_MOV
-                    SET data_modificacao = %s
-                    WHERE movimentacao = %s
-                    """,
-                    [data_modificacao, movimentacao],
+
+            return resposta_sem_conteudo(codigo, mensagem, rejeitadas)
+
+        except Exception as e:
+            return Response(
+                {"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @extend_schema(
+        tags=["ScanMove"],
+        operation_id="excluir_pecas_lote",
+        request=ExcluiPecasSerializer,
+        responses={204: None, 400: OpenApiTypes.OBJECT, 404: OpenApiTypes.OBJECT},
+    )
+    def excluir_pecas_lote(self, request, movimentacao=None):
+        serializer = ExcluiPecasSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic(), connections["default"].cursor() as cursor:
+                codigo, mensagem, _ = MovimentacaoService().excluir_pecas(
+                    cursor,
+                    movimentacao,
+                    serializer.validated_data["pecas"],
+                    serializer.validated_data["data_modificacao"],
                 )
 
-            return Response(status=status.HTTP_201_CREATED)
+            return resposta_sem_conteudo(codigo, mensagem)
 
         except Exception as e:
             return Response(
@@ -676,6 +1030,8 @@ class MovimentacaoViewSet(viewsets.ViewSet):
         tags=["ScanMove"],
         operation_id="excluir_pecas",
         responses={204: None},
+        deprecated=True,
+        description="Use excluir_pecas_lote, com a lista de peças no corpo.",
     )
     @action(
         detail=True,
@@ -697,57 +1053,15 @@ class MovimentacaoViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Convertendo os IDs das peças em uma lista de inteiros
-        pecas_para_excluir = [int(id) for id in pecas_ids.split(",")]
+        pecas_para_excluir = [peca.strip() for peca in pecas_ids.split(",")]
 
         try:
-            with connections["default"].cursor() as cursor:
-                # Verifica se a movimentação existe e obtém o status atual
-                cursor.execute(
-                    "SELECT status FROM KING_ESTOQUE_MAT_MOV WHERE movimentacao = %s",
-                    [movimentacao],
-                )
-                resultado = cursor.fetchone()
-
-                if resultado is None:
-                    return Response(
-                        {"detail": "Movimentação não encontrada."},
-                        status=status.HTTP_404_NOT_FOUND,
-                    )
-
-                status_atual = resultado[0]
-
-                # Verifica se a movimentação já está finalizada
-                if status_atual == "Finalizada":
-                    return Response(
-                        {
-                            "detail": "A movimentação já está finalizada e não pode ser alterada."
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                # Atualiza a 'data_modificacao' da movimentação
-                cursor.execute(
-                    """
-                    UPDATE KING_ESTOQUE_MAT_MOV
-                    SET data_modificacao = %s
-                    WHERE movimentacao = %s
-                    """,
-                    [data_modificacao, movimentacao],
+            with transaction.atomic(), connections["default"].cursor() as cursor:
+                codigo, mensagem, _ = MovimentacaoService().excluir_pecas(
+                    cursor, movimentacao, pecas_para_excluir, data_modificacao
                 )
 
-                # Deleta as peças especificadas
-                placeholders = ", ".join(
-                    ["%s"] * len(pecas_para_excluir)
-                )  # Cria placeholders %s,%s,%s,...
-                sql = f"""
-                    DELETE FROM KING_ESTOQUE_MAT_MOV_PECA 
-                    WHERE movimentacao = %s AND peca IN ({placeholders})
-                """
-                params = [movimentacao] + pecas_para_excluir
-                cursor.execute(sql, params)
-
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            return resposta_sem_conteudo(codigo, mensagem)
 
         except Exception as e:
             return Response(
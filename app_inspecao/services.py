@@ -1,5 +1,7 @@
 from django.db import connections, transaction, IntegrityError
 
+from kingjoe.db import primeira, todas
+
 
 class OrdemProducaoService:
 
@@ -13,8 +15,8 @@ class OrdemProducaoService:
                     KPI.STATUS AS STATUS_INSPECAO,
                     KPI.DATA_ABERTURA,
                     KPI.DATA_ALTERACAO,
-                    USU_ABE.USERNAME,
-                    USU_ALT.USERNAME,
+                    USU_ABE.USERNAME AS USUARIO_ABERTURA,
+                    USU_ALT.USERNAME AS USUARIO_ALTERACAO,
                     KPL.FASE_PRODUCAO,
                     KPL.RECURSO_PRODUTIVO,
                     TRIM(PR.DESC_RECURSO) AS DESC_RECURSO,
@@ -47,7 +49,7 @@ class OrdemProducaoService:
                 """,
                 [ordem_producao],
             )
-            rows = cursor.fetchall()
+            rows = todas(cursor)
 
         if not rows:
             return None
@@ -93,7 +95,7 @@ class OrdemProducaoService:
                     """,
                 [ordem_producao],
             )
-            rows = cursor.fetchall()
+            rows = todas(cursor)
 
         if not rows:
             return None
@@ -108,24 +110,25 @@ class OrdemProducaoService:
         lotes = {}
 
         for row in rows:
-            # Captura dos valores conforme os índices identificados
-            ordem_producao = row[0]
-            produto = row[1]
-            status_inspecao = row[2]
-            data_abertura = row[3]
-            data_alteracao = row[4]
-            usuario_abertura = row[5]
-            usuario_alteracao = row[6]
-            fase_producao = row[7]
-            recurso_produtivo = row[8]
-            desc_recurso = row[9]
-            status_lote = row[10] if row[10] is not None else "Pendente"
-            desc_fase_producao = row[11]
-            cor_produto = row[12]
-            desc_cor_produto = row[13]
-            total = row[14]
-            amostra = row[15] if row[15] is not None else self.calcular_amostra(total)
-            status_cor = row[16] if row[16] is not None else "Pendente"
+            ordem_producao = row.ordem_producao
+            produto = row.produto
+            status_inspecao = row.status_inspecao
+            data_abertura = row.data_abertura
+            data_alteracao = row.data_alteracao
+            usuario_abertura = row.usuario_abertura
+            usuario_alteracao = row.usuario_alteracao
+            fase_producao = row.fase_producao
+            recurso_produtivo = row.recurso_produtivo
+            desc_recurso = row.desc_recurso
+            status_lote = row.status_lote if row.status_lote is not None else "Pendente"
+            desc_fase_producao = row.desc_fase_producao
+            cor_produto = row.cor_produto
+            desc_cor_produto = row.desc_cor_produto
+            total = row.total
+            amostra = (
+                row.amostra if row.amostra is not None else self.calcular_amostra(total)
+            )
+            status_cor = row.status_cor if row.status_cor is not None else "Pendente"
 
             # Montando o lote
             if recurso_produtivo not in lotes:
@@ -212,7 +215,7 @@ class OrdemProducaoService:
                     """,
                     [ordem_producao, produto],
                 )
-                inspecao_existente = cursor.fetchone()
+                inspecao_existente = primeira(cursor)
 
             if inspecao_existente:
                 return (409, "Já existe inspeção para esta ordem de produção", None)
@@ -293,7 +296,7 @@ class OrdemProducaoService:
                     """,
                     [ordem_producao],
                 )
-                inspecao_existente = cursor.fetchone()
+                inspecao_existente = primeira(cursor)
 
             if not inspecao_existente:
                 return (
@@ -303,7 +306,7 @@ class OrdemProducaoService:
                 )
 
             # Verificar se o status é 'Encerrada'
-            status_inspecao = inspecao_existente[0]
+            status_inspecao = inspecao_existente.status
             if status_inspecao == 'Encerrada':
                 return (
                     400,
@@ -340,7 +343,7 @@ class OrdemProducaoService:
                     """,
                     [ordem_producao],
                 )
-                inspecao_existente = cursor.fetchone()
+                inspecao_existente = primeira(cursor)
 
             if not inspecao_existente:
                 return (
@@ -359,7 +362,7 @@ class OrdemProducaoService:
                         """,
                         [ordem_producao],
                     )
-                    lote_nao_finalizado = cursor.fetchone()
+                    lote_nao_finalizado = primeira(cursor)
 
                 if lote_nao_finalizado:
                     return (
@@ -390,7 +393,7 @@ class OrdemProducaoService:
                         """,
                         [ordem_producao],
                     )
-                    data_alteracao_atualizada = cursor.fetchone()[0]
+                    data_alteracao_atualizada = primeira(cursor).data_alteracao
 
             result = {
                 "data_alteracao": data_alteracao_atualizada,
@@ -0,0 +1,116 @@
+"""
+Mapeamento leve de resultados de SQL bruto.
+
+Cada formato de resultado (nomes das colunas do cursor.description) gera uma única
+vez uma classe de linha com __slots__, reaproveitada por todas as execuções da mesma
+consulta. As colunas viram atributos em minúsculas e também podem ser lidas por chave.
+Com aparar=True, as colunas de texto já chegam sem espaços nas pontas, uma única vez,
+no momento do mapeamento.
+"""
+
+from functools import lru_cache
+from keyword import iskeyword
+
+
+class Linha:
+    """Base das linhas tipadas: atributos em __slots__ com acesso também por chave."""
+
+    __slots__ = ()
+
+    def __getitem__(self, chave):
+        return getattr(self, chave)
+
+    def __setitem__(self, chave, valor):
+        setattr(self, chave, valor)
+
+    def __contains__(self, chave):
+        return chave in self.__slots__
+
+    def get(self, chave, padrao=None):
+        return getattr(self, chave, padrao)
+
+    def keys(self):
+        return self.__slots__
+
+    def as_dict(self):
+        return {nome: getattr(self, nome) for nome in self.__slots__}
+
+    def __eq__(self, outra):
+        return type(self) is type(outra) and all(
+            getattr(self, nome) == getattr(outra, nome) for nome in self.__slots__
+        )
+
+    def __repr__(self):
+        valores = ", ".join(
+            f"{nome}={getattr(self, nome)!r}" for nome in self.__slots__
+        )
+        return f"Linha({valores})"
+
+
+def _nome_atributo(nome, indice, usados):
+    nome = (nome or "").lower()
+    if not nome.isidentifier() or iskeyword(nome) or nome in usados:
+        nome = f"coluna_{indice}"
+    usados.add(nome)
+    return nome
+
+
+@lru_cache(maxsize=512)
+def _criar_tipo(colunas, textos, extras):
+    usados = set()
+    nomes = tuple(_nome_atributo(nome, i, usados) for i, nome in enumerate(colunas))
+    extras = tuple(nome for nome in extras if nome not in usados)
+
+    # __init__ gerado com atribuições diretas, sem laço por coluna a cada linha
+    parametros = ", ".join(nomes + tuple(f"{nome}=None" for nome in extras))
+    atribuicoes = [
+        (
+            f"    self.{nome} = {nome}.strip() if {nome} is not None else None"
+            if texto
+            else f"    self.{nome} = {nome}"
+        )
+        for nome, texto in zip(nomes, textos)
+    ]
+    atribuicoes += [f"    self.{nome} = {nome}" for nome in extras]
+    corpo = "\n".join(atribuicoes) or "    pass"
+    namespace = {}
+    exec(f"def __init__(self, {parametros}):\n{corpo}", namespace)
+
+    return type(
+        "Linha",
+        (Linha,),
+        {"__slots__": nomes + extras, "__init__": namespace["__init__"]},
+    )
+
+
+def tipo_linha(cursor, extras=(), aparar=False):
+    """
+    Classe de linha para o resultado atual do cursor. extras são atributos a mais,
+    iniciados com None, para dados preenchidos depois da consulta.
+    """
+    colunas = tuple(col[0] for col in cursor.description)
+    textos = tuple(aparar and col[1] is str for col in cursor.description)
+    return _criar_tipo(colunas, textos, tuple(extras))
+
+
+def linhas(cursor, extras=(), tamanho_bloco=500, aparar=False):
+    """Gera as linhas do resultado lendo o cursor em blocos de fetchmany."""
+    tipo = tipo_linha(cursor, extras, aparar)
+    while True:
+        rows = cursor.fetchmany(tamanho_bloco)
+        if not rows:
+            return
+        for row in rows:
+            yield tipo(*row)
+
+
+def todas(cursor, extras=(), aparar=False):
+    return list(linhas(cursor, extras, aparar=aparar))
+
+
+def primeira(cursor, extras=(), aparar=False):
+    """Primeira linha do resultado ou None."""
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return tipo_linha(cursor, extras, aparar)(*row)
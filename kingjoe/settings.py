@@ -113,6 +113,39 @@ SPECTACULAR_SETTINGS = {
 }
 
 
+# Configurações do ScanMove (app_estoque_mp)
+# Intervalo, em segundos, entre as atualizações incrementais do catálogo de materiais e cores
+ESTOQUE_CATALOGO_TTL = 300
+# Intervalo, em segundos, entre as recargas do índice de localizações (MATERIAIS_LOCALIZA)
+ESTOQUE_LOCALIZACOES_TTL = 600
+# Aceita a finalização assíncrona (assincrono=True). Exige o processar_finalizacoes rodando
+# (serviço processar_finalizacoes do Docker-compose.yml); sem ela, a finalização é síncrona
+ESTOQUE_FINALIZACAO_ASSINCRONA = True
+# Finalização assíncrona: prazo, em segundos, de uma reserva do processar_finalizacoes antes
+# de a linha voltar à fila; tentativas antes de 'Falhou'; espera inicial entre tentativas
+# (dobra a cada falha)
+ESTOQUE_FINALIZACAO_PRAZO = 600
+ESTOQUE_FINALIZACAO_TENTATIVAS = 5
+ESTOQUE_FINALIZACAO_ESPERA = 30
+# Peças por comando UPDATE na realocação da finalização (abaixo do limite de escalonamento
+# de locks do SQL Server, de 5000 por comando)
+ESTOQUE_LOTE_REALOCACAO = 500
+# Confere existência, origem e dados das peças antes de incluí-las em uma movimentação
+ESTOQUE_VALIDAR_PECAS = True
+# Cache, por usuário, das peças da origem da movimentação em andamento: validade em segundos
+# (0 desliga), usuários em memória e maior número de peças guardado por localização
+ESTOQUE_PREFETCH_TTL = 300
+ESTOQUE_PREFETCH_USUARIOS = 200
+ESTOQUE_PREFETCH_MAX_PECAS = 5000
+# Arquivamento: idade, em dias desde a última modificação, das movimentações finalizadas
+# movidas para as tabelas de arquivo e movimentações por lote (arquivar_movimentacoes)
+ESTOQUE_ARQUIVAMENTO_DIAS = 180
+ESTOQUE_LOTE_ARQUIVAMENTO = 200
+# Feed de alterações: idade máxima, em dias, de um token ou data/hora aceitos; os registros
+# de exclusão mais antigos que isso são expurgados pelo arquivar_movimentacoes
+ESTOQUE_ALTERACOES_DIAS = 30
+
+
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",